@@ -0,0 +1,1026 @@
+import copy
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import queue
+import re
+import sqlite3
+import time
+import zlib
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.optim import SGD, Adam
+from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler
+from natasha import Doc, NewsEmbedding, NewsMorphTagger, Segmenter
+
+
+def iter_corpus_records(path, key='data', buffer_size=1 << 20):
+    """
+    Читает записи массива key из JSON-файла корпуса по одной, не загружая файл в память целиком:
+    файл читается блоками по buffer_size символов, записи разбираются json.JSONDecoder.raw_decode.
+    """
+    decoder = json.JSONDecoder()
+    separators = re.compile(r'[\s,]*')
+    with open(path, 'r', encoding='utf-8') as f:
+        # пропускаем все до начала массива записей
+        buffer = ''
+        while True:
+            chunk = f.read(buffer_size)
+            buffer += chunk
+            match = re.search(rf'"{key}"\s*:\s*\[', buffer)
+            if match:
+                buffer = buffer[match.end():]
+                break
+            if not chunk:
+                raise ValueError(f"В файле {path} нет массива '{key}'")
+            buffer = buffer[-256:]
+
+        position = 0
+        while True:
+            position = separators.match(buffer, position).end()
+            if buffer.startswith(']', position):
+                return
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # запись не поместилась в буфер целиком - дочитываем файл
+                chunk = f.read(buffer_size)
+                if not chunk:
+                    raise
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield record
+
+
+_tag_segmenter = None
+_tag_morph_tagger = None
+
+
+def _init_tag_worker():
+    """Инициализирует процесс пула разметки: модели natasha загружаются один раз на процесс."""
+    global _tag_segmenter, _tag_morph_tagger
+    _tag_segmenter = Segmenter()
+    _tag_morph_tagger = NewsMorphTagger(NewsEmbedding())
+
+
+def _tag_texts(texts):
+    """
+    Размечает тексты; для каждого - список [словоформа в нижнем регистре, PoS, признаки, число вхождений],
+    признаки - строка в формате Universal Dependencies ('Case=Nom|Number=Sing', см. parse_feats).
+    """
+    if _tag_morph_tagger is None:
+        _init_tag_worker()
+    results = []
+    for text in texts:
+        doc = Doc(text)
+        # сегментируем на токены и предложения, тэггируем части речи
+        doc.segment(_tag_segmenter)
+        doc.tag_morph(_tag_morph_tagger)
+        counts = Counter((tok.text.lower(), tok.pos, '|'.join(f'{k}={v}' for k, v in sorted((tok.feats or {}).items())))
+                         for tok in doc.tokens)
+        results.append([[form, pos, feats, n] for (form, pos, feats), n in counts.items()])
+    return results
+
+
+def parse_feats(feats):
+    """Строка признаков 'Case=Nom|Number=Sing' -> словарь, как у токенов natasha."""
+    return dict(feat.split('=', 1) for feat in feats.split('|')) if feats else {}
+
+
+def tag_corpus(texts, cache_path='tags.sqlite', batch_size=256, n_jobs=None):
+    """
+    Морфологическая разметка потока текстов natasha в пуле из n_jobs процессов с кэшем на диске (SQLite, cache_path):
+    сжатая разметка каждого текста хранится по хэшу его содержимого, поэтому повторный запуск и другие
+    корпуса с теми же текстами размечают только новые тексты. Пока сливается текущая пачка, пул размечает следующую.
+    Возвращает словарь словоформа (в нижнем регистре) -> Counter {(PoS, признаки): число вхождений}
+    и отчет (всего текстов, из них размечено заново, время).
+    """
+    n_jobs = n_jobs or os.cpu_count()
+    tag_counts = defaultdict(Counter)
+    report = {'texts': 0, 'tagged': 0, 'seconds': 0.0}
+    start = time.perf_counter()
+    connection = sqlite3.connect(cache_path)
+    connection.execute('CREATE TABLE IF NOT EXISTS tags (hash TEXT PRIMARY KEY, tags BLOB)')
+
+    def add_tags(tags):
+        for form, pos, feats, n in tags:
+            tag_counts[form][pos, feats] += n
+
+    def lookup(batch):
+        # хэши текстов пачки и разметка тех из них, что уже есть в кэше
+        hashes = [hashlib.sha1(text.encode('utf-8')).hexdigest() for text in batch]
+        unique = list(dict.fromkeys(hashes))
+        cached = {}
+        for i in range(0, len(unique), 500):
+            part = unique[i:i + 500]
+            query = f"SELECT hash, tags FROM tags WHERE hash IN ({', '.join('?' * len(part))})"
+            cached.update((h, json.loads(zlib.decompress(tags))) for h, tags in connection.execute(query, part))
+        missing = {h: text for h, text in zip(hashes, batch) if h not in cached}
+        return hashes, cached, missing
+
+    def merge(hashes, cached, missing, results):
+        fresh = dict(zip(missing, results))
+        connection.executemany('INSERT OR REPLACE INTO tags VALUES (?, ?)',
+                               [(h, zlib.compress(json.dumps(tags, ensure_ascii=False).encode('utf-8')))
+                                for h, tags in fresh.items()])
+        connection.commit()
+        for h in hashes:
+            add_tags(cached[h] if h in cached else fresh[h])
+        report['texts'] += len(hashes)
+        report['tagged'] += len(fresh)
+
+    texts = iter(texts)
+    batches = iter(lambda: list(islice(texts, batch_size)), [])
+    try:
+        if n_jobs == 1:
+            for batch in batches:
+                hashes, cached, missing = lookup(batch)
+                merge(hashes, cached, missing, _tag_texts(list(missing.values())))
+        else:
+            context = mp.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context, initializer=_init_tag_worker) as pool:
+                def submit(batch):
+                    hashes, cached, missing = lookup(batch)
+                    missing_texts = list(missing.values())
+                    chunk = max(1, -(-len(missing_texts) // n_jobs))
+                    futures = [pool.submit(_tag_texts, missing_texts[i:i + chunk])
+                               for i in range(0, len(missing_texts), chunk)]
+                    return hashes, cached, missing, futures
+
+                def finish(hashes, cached, missing, futures):
+                    merge(hashes, cached, missing, list(chain.from_iterable(future.result() for future in futures)))
+
+                in_progress = None
+                for batch in batches:
+                    submitted = submit(batch)
+                    if in_progress is not None:
+                        finish(*in_progress)
+                    in_progress = submitted
+                if in_progress is not None:
+                    finish(*in_progress)
+    finally:
+        connection.close()
+    report['seconds'] = time.perf_counter() - start
+    return tag_counts, report
+
+
+def tokenize(text):
+    """Разбивает текст на токены (слова и цифры), приводит к нижнему регистру."""
+    return re.findall(r'[\w\d]+', text.lower())
+
+
+_encode_stop_words = set()
+
+
+def _init_encode_worker(stop_words):
+    """Инициализирует процесс пула предобработки: стоп-слова передаются один раз, а не с каждой пачкой."""
+    global _encode_stop_words
+    _encode_stop_words = stop_words
+
+
+def _encode_texts(texts, is_train):
+    """
+    Токенизирует пачку текстов без стоп-слов и кодирует слова номерами в словаре пачки.
+    Возвращает слова пачки, их документо-частоты в обучающих текстах (is_train)
+    и для train и val - токены текстов подряд и длины текстов.
+    """
+    vocabulary = {}
+    texts_ids = [[vocabulary.setdefault(word, len(vocabulary)) for word in tokenize(text)
+                  if word not in _encode_stop_words] for text in texts]
+    lengths = np.fromiter(map(len, texts_ids), dtype=np.int64, count=len(texts_ids))
+    tokens = np.fromiter(chain.from_iterable(texts_ids), dtype=np.int32, count=lengths.sum())
+    is_train = np.asarray(is_train, dtype=bool)
+    token_is_train = np.repeat(is_train, lengths)
+
+    # считаем по документо-частоте, а не по частоте вхождений: пары (документ, слово) без повторов
+    docs = np.repeat(np.arange(len(texts_ids)), lengths)[token_is_train]
+    doc_words = np.unique(docs * len(vocabulary) + tokens[token_is_train])
+    doc_freq = np.bincount(doc_words % max(len(vocabulary), 1), minlength=len(vocabulary))
+    return {
+        'words': list(vocabulary),
+        'doc_freq': doc_freq,
+        'train_tokens': tokens[token_is_train],
+        'train_lengths': lengths[is_train],
+        'val_tokens': tokens[~token_is_train],
+        'val_lengths': lengths[~is_train]
+    }
+
+
+class EncodedCorpus:
+    """
+    Корпус, закодированный ID слов: токены всех текстов подряд (массив int32, обычно отображенный
+    в память из файла) и смещения начала текстов. Индексируется как список текстов: corpus[i] -
+    массив ID i-го текста, corpus[a:b] - EncodedCorpus над теми же токенами без копирования.
+    """
+    def __init__(self, tokens, offsets):
+        self.tokens = tokens
+        self.offsets = offsets
+
+    @classmethod
+    def from_texts(cls, data_ids):
+        """Собирает корпус из списка текстов, где каждый текст - список ID токенов."""
+        lengths = np.fromiter((len(text) for text in data_ids), dtype=np.int64, count=len(data_ids))
+        tokens = np.fromiter(chain.from_iterable(data_ids), dtype=np.int32, count=lengths.sum())
+        return cls(tokens, np.concatenate([[0], np.cumsum(lengths)]))
+
+    @classmethod
+    def load(cls, path):
+        """Открывает корпус, записанный preprocess_corpus: токены path.bin (mmap) и смещения path_offsets.npy."""
+        offsets = np.load(path + '_offsets.npy')
+        if offsets[-1] == 0:
+            return cls(np.zeros(0, dtype=np.int32), offsets)
+        return cls(np.memmap(path + '.bin', dtype=np.int32, mode='r'), offsets)
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step != 1:
+                raise ValueError("Срез корпуса поддерживается только с шагом 1")
+            offsets = self.offsets[start:max(start, stop) + 1]
+            return EncodedCorpus(self.tokens[offsets[0]:offsets[-1]], offsets - offsets[0])
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return self.tokens[self.offsets[idx]:self.offsets[idx + 1]]
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+def _remap_corpus(raw_path, lengths, remap, path, block_size=1 << 22):
+    """
+    Перекодирует предварительные ID токенов из raw_path в ID словаря (remap, 0 - слово не в словаре
+    и отбрасывается) блоками по block_size токенов и сохраняет результат как EncodedCorpus в path.
+    """
+    raw_offsets = np.concatenate([[0], np.cumsum(lengths)])
+    new_lengths = np.zeros(len(lengths), dtype=np.int64)
+    raw = np.memmap(raw_path, dtype=np.int32, mode='r') if raw_offsets[-1] else np.zeros(0, dtype=np.int32)
+    with open(path + '.bin', 'wb') as f:
+        for start in range(0, len(raw), block_size):
+            ids = remap[raw[start:start + block_size]]
+            kept = np.flatnonzero(ids)
+            f.write(ids[kept].tobytes())
+            docs = np.searchsorted(raw_offsets, start + kept, side='right') - 1
+            new_lengths += np.bincount(docs, minlength=len(lengths))
+    del raw
+    os.remove(raw_path)
+    np.save(path + '_offsets.npy', np.concatenate([[0], np.cumsum(new_lengths)]))
+    return EncodedCorpus.load(path)
+
+
+def preprocess_corpus(path, stop_words, out_dir, train_share=0.8, val_share=0.2, batch_size=1000,
+                      n_jobs=None, seed=0, pad_word='<PAD>'):
+    """
+    Потоковая предобработка корпуса: записи читаются по одной (iter_corpus_records), каждый документ
+    с вероятностью train_share попадает в train, с вероятностью val_share - в val, остальные пропускаются.
+    Пачки по batch_size текстов токенизируются в пуле из n_jobs процессов, документо-частоты пачек
+    сливаются в общий счетчик, а тексты сразу дописываются в файлы out_dir с предварительными ID слов.
+    В памяти одновременно не больше двух пачек текстов. После прохода строится словарь (как раньше:
+    без стоп-слов и слов из одного документа, по убыванию частоты), и токены перекодируются в его ID.
+    Возвращает:
+        word2id: соответствие слово -> индекс
+        word_doc_freq: частотность слов в корпусе (доля обучающих документов, где слово встретилось)
+        train_ids, val_ids: EncodedCorpus, токены которых лежат в out_dir/train.bin и out_dir/val.bin
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    n_jobs = n_jobs or os.cpu_count()
+    rng = np.random.default_rng(seed)
+    vocabulary = {}  # слово -> предварительный ID (в порядке первого появления)
+    doc_freq = np.zeros(0, dtype=np.int64)
+    parts = {part: {'file': open(os.path.join(out_dir, f'{part}.raw'), 'wb'), 'lengths': []}
+             for part in ('train', 'val')}
+
+    def sample_batch(records):
+        # разбиение решается в основном процессе, поэтому не зависит от числа процессов пула
+        draws = rng.random(len(records))
+        selected = np.flatnonzero(draws < train_share + val_share)
+        return [records[i]['text'] for i in selected], draws[selected] < train_share
+
+    def merge(chunk):
+        nonlocal doc_freq
+        ids = np.fromiter((vocabulary.setdefault(word, len(vocabulary)) for word in chunk['words']),
+                          dtype=np.int32, count=len(chunk['words']))
+        doc_freq = np.concatenate([doc_freq, np.zeros(len(vocabulary) - len(doc_freq), dtype=np.int64)])
+        doc_freq[ids] += chunk['doc_freq']
+        for part, state in parts.items():
+            state['file'].write(ids[chunk[f'{part}_tokens']].tobytes())
+            state['lengths'].append(chunk[f'{part}_lengths'])
+
+    records = iter_corpus_records(path)
+    batches = iter(lambda: list(islice(records, batch_size)), [])
+    try:
+        if n_jobs == 1:
+            _init_encode_worker(stop_words)
+            for batch in batches:
+                merge(_encode_texts(*sample_batch(batch)))
+        else:
+            # spawn: процессы пула не наследуют состояние ноутбука (в том числе CUDA), обработчики импортируются из модуля
+            context = mp.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context, initializer=_init_encode_worker,
+                                     initargs=(stop_words,)) as pool:
+                def submit(batch):
+                    texts, is_train = sample_batch(batch)
+                    chunk = max(1, -(-len(texts) // n_jobs))
+                    return [pool.submit(_encode_texts, texts[i:i + chunk], is_train[i:i + chunk])
+                            for i in range(0, len(texts), chunk)]
+
+                # пока сливается текущая пачка, пул уже токенизирует следующую
+                in_progress = []
+                for batch in batches:
+                    submitted = submit(batch)
+                    for future in in_progress:
+                        merge(future.result())
+                    in_progress = submitted
+                for future in in_progress:
+                    merge(future.result())
+    finally:
+        for state in parts.values():
+            state['file'].close()
+
+    train_lengths = np.concatenate([np.zeros(0, dtype=np.int64)] + parts['train']['lengths'])
+    val_lengths = np.concatenate([np.zeros(0, dtype=np.int64)] + parts['val']['lengths'])
+
+    # удаляем редкие слова (встретились только в 1 документе) и сортируем по убыванию частоты
+    order = np.argsort(-doc_freq, kind='stable')
+    order = order[doc_freq[order] > 1]
+    words = list(vocabulary)
+    word2id = {pad_word: 0}
+    word2id.update((words[i], new_id) for new_id, i in enumerate(order, start=1))
+    remap = np.zeros(len(vocabulary), dtype=np.int32)
+    remap[order] = np.arange(1, len(order) + 1)
+
+    word_doc_freq = np.concatenate([[0], doc_freq[order]]).astype('float32')
+    # нормируем, чтобы получить вероятность встретить слово в случайном документе
+    word_doc_freq /= max(len(train_lengths), 1)
+
+    train_ids = _remap_corpus(os.path.join(out_dir, 'train.raw'), train_lengths, remap,
+                              os.path.join(out_dir, 'train'))
+    val_ids = _remap_corpus(os.path.join(out_dir, 'val.raw'), val_lengths, remap,
+                            os.path.join(out_dir, 'val'))
+    return word2id, word_doc_freq, train_ids, val_ids
+
+
+def build_alias_table(weights):
+    """
+    Таблица псевдонимов (метод Уолкера-Возе) для выборки из дискретного распределения за O(1):
+    ячейка i выбирается равновероятно и с вероятностью prob[i] дает i, иначе alias[i].
+    """
+    p = np.asarray(weights, dtype=np.float64)
+    p = p * len(p) / p.sum()
+    prob = np.ones(len(p))
+    alias = np.arange(len(p))
+    small = [i for i in range(len(p)) if p[i] < 1]
+    large = [i for i in range(len(p)) if p[i] >= 1]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s], alias[s] = p[s], l
+        # недостающую часть ячейки s отдает слово l
+        p[l] -= 1 - p[s]
+        (small if p[l] < 1 else large).append(l)
+    # оставшиеся ячейки (из-за погрешности округления) заполнены целиком: prob = 1
+    return torch.tensor(prob), torch.tensor(alias)
+
+
+class NegativeSampler:
+    """Негативные примеры из униграммного распределения в степени power (сглаженного, как в word2vec)."""
+    def __init__(self, word_freq, power=0.75):
+        self.prob, self.alias = build_alias_table(np.asarray(word_freq, dtype=np.float64) ** power)
+
+    def sample(self, shape):
+        """Тензор ID слов заданной формы одной векторной операцией."""
+        idx = torch.randint(len(self.prob), shape)
+        return torch.where(torch.rand(shape) < self.prob[idx], idx, self.alias[idx])
+
+
+class SkipGramDataset(Dataset):
+    def __init__(self, data_ids, window_size, neg_samples, vocab_size, word_freq=None, subsample=1e-3,
+                 dynamic_window=True, seed=0, token_freq=None):
+        """
+        data_ids: EncodedCorpus или список текстов, где каждый текст - список ID токенов.
+        word_freq: частоты слов (например, word_doc_freq) для выборки негативных примеров
+            из распределения freq^0.75; по умолчанию негативные примеры равновероятны.
+        subsample: порог t прореживания частых слов (как у Миколова): слово с долей f среди токенов
+            корпуса остается с вероятностью (sqrt(f/t) + 1) * t/f; None - без прореживания.
+            Доли f берутся из token_freq, по умолчанию считаются по data_ids.
+        dynamic_window: для каждого центра размер окна выбирается равновероятно от 1 до window_size,
+            поэтому близкие слова контекста попадают в пары чаще далеких.
+        Пары (центр, контекст) хранятся двумя массивами int32, resample() генерирует их заново.
+        """
+        self.data_ids = data_ids
+        self.window_size = window_size
+        self.neg_samples = neg_samples
+        self.vocab_size = vocab_size
+        self.dynamic_window = dynamic_window
+        self.rng = np.random.default_rng(seed)
+        if word_freq is None:
+            word_freq = np.r_[0, np.ones(vocab_size - 1)]
+        self.neg_sampler = NegativeSampler(word_freq)
+
+        if not isinstance(data_ids, EncodedCorpus):
+            data_ids = EncodedCorpus.from_texts(data_ids)
+        self.tokens = np.asarray(data_ids.tokens)
+        self.doc = np.repeat(np.arange(len(data_ids)), data_ids.lengths())
+        self.keep_prob = None
+        if subsample is not None:
+            if token_freq is None:
+                token_freq = np.bincount(self.tokens, minlength=vocab_size) / max(len(self.tokens), 1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.keep_prob = np.minimum((np.sqrt(token_freq / subsample) + 1) * subsample / token_freq, 1)
+        self.resample()
+
+    def resample(self):
+        """Заново прореживает корпус и выбирает размеры окон (обычно перед каждой эпохой)."""
+        tokens, doc = self.tokens, self.doc
+        if self.keep_prob is not None:
+            # отброшенные слова удаляются из текста до построения окон, поэтому окна становятся шире
+            kept = self.rng.random(len(tokens)) < self.keep_prob[tokens]
+            tokens, doc = tokens[kept], doc[kept]
+        # число слов корпуса, по которым построены пары (для оценки скорости обучения в словах/с)
+        self.n_words = len(tokens)
+        if self.dynamic_window:
+            windows = self.rng.integers(1, self.window_size + 1, size=len(tokens))
+        else:
+            windows = np.full(len(tokens), self.window_size)
+        positions = np.arange(len(tokens))
+        centers, contexts = [], []
+        for shift in range(-self.window_size, self.window_size + 1):
+            if shift == 0:
+                continue
+            # позиции, у которых слово на расстоянии shift есть в том же тексте и входит в окно
+            i = positions[max(0, -shift):len(tokens) - max(0, shift)]
+            i = i[(doc[i] == doc[i + shift]) & (windows[i] >= abs(shift))]
+            centers.append(i)
+            contexts.append(i + shift)
+        centers = np.concatenate(centers)
+        contexts = np.concatenate(contexts)
+        # порядок пар - по позиции центра, затем контекста (как при обходе текстов слева направо)
+        order = np.lexsort((contexts, centers))
+        self.centers = tokens[centers[order]]
+        self.contexts = tokens[contexts[order]]
+
+    def __len__(self):
+        return len(self.centers)
+
+    def __getitem__(self, idx):
+        """
+        idx - номер пары или список номеров (целый батч от BatchSampler).
+        Для батча центры, контексты и негативные примеры (batch, neg_samples)
+        возвращаются непрерывными тензорами без поэлементной сборки.
+        """
+        center = torch.as_tensor(self.centers[idx], dtype=torch.long)
+        pos_context = torch.as_tensor(self.contexts[idx], dtype=torch.long)
+        neg_contexts = self.neg_sampler.sample(center.shape + (self.neg_samples,))
+        return center, pos_context, neg_contexts
+
+
+class SkipGramNegSampling(nn.Module):
+    def __init__(self, vocab_size, embedding_dim, sparse=False):
+        super(SkipGramNegSampling, self).__init__()
+        # sparse=True: градиенты только по строкам слов батча (для SGD/SparseAdam и обучения Hogwild)
+        self.center_emb = nn.Embedding(vocab_size, embedding_dim, padding_idx=0, sparse=sparse)
+        self.context_emb = nn.Embedding(vocab_size, embedding_dim, padding_idx=0, sparse=sparse)
+
+        # Инициализация (Xavier)
+        nn.init.xavier_uniform_(self.center_emb.weight)
+        nn.init.xavier_uniform_(self.context_emb.weight)
+        # Обнуляем паддинг
+        self.center_emb.weight.data[0] = 0
+        self.context_emb.weight.data[0] = 0
+
+    def forward(self, center, pos_context, neg_contexts):
+        """
+        center: (batch_size,)
+        pos_context: (batch_size,)
+        neg_contexts: (batch_size, neg_samples)
+        """
+        center_vec = self.center_emb(center)  # (batch, emb_dim)
+        pos_vec = self.context_emb(pos_context)  # (batch, emb_dim)
+        neg_vecs = self.context_emb(neg_contexts)  # (batch, neg_samples, emb_dim)
+
+        # Положительное сходство (чем больше, тем лучше)
+        pos_score = torch.sum(center_vec * pos_vec, dim=1)  # (batch,)
+        pos_loss = -F.logsigmoid(pos_score).mean()
+
+        # Отрицательное сходство (чем меньше, тем лучше)
+        neg_score = torch.bmm(neg_vecs, center_vec.unsqueeze(2)).squeeze()  # (batch, neg_samples)
+        neg_loss = -F.logsigmoid(-neg_score).mean()
+
+        return pos_loss + neg_loss
+
+    def get_center_vector(self, word_idx):
+        return self.center_emb(torch.tensor([word_idx])).detach().cpu().numpy()[0]
+
+
+def _hogwild_worker(rank, model, data_ids, dataset_params, epochs, batch_size, lr, optimizer, seed, stats):
+    """Процесс Hogwild: строит пары по своему шарду корпуса и без блокировок обновляет общие веса модели."""
+    try:
+        # по одному потоку на процесс, иначе процессы делят ядра между потоками BLAS
+        torch.set_num_threads(1)
+        torch.manual_seed(seed + rank)
+        rng = np.random.default_rng(seed + rank)
+        dataset = SkipGramDataset(data_ids, seed=seed + rank, **dataset_params)
+        if optimizer == 'sparse_adam':
+            optimizer = torch.optim.SparseAdam(model.parameters(), lr=lr)
+        else:
+            optimizer = SGD(model.parameters(), lr=lr)
+
+        for epoch in range(epochs):
+            if epoch > 0:
+                dataset.resample()
+            start = time.perf_counter()
+            total_loss = 0
+            batch_count = 0
+            order = rng.permutation(len(dataset))
+            for i in range(0, len(order), batch_size):
+                centers, pos_contexts, neg_contexts = dataset[order[i:i + batch_size]]
+                optimizer.zero_grad()
+                loss = model(centers, pos_contexts, neg_contexts)
+                loss.backward()
+                optimizer.step()
+                total_loss += loss.item()
+                batch_count += 1
+            seconds = time.perf_counter() - start
+            stats.put({'worker': rank, 'epoch': epoch + 1, 'words': dataset.n_words, 'pairs': len(dataset),
+                       'seconds': seconds, 'words_per_sec': dataset.n_words / seconds if seconds else 0.0,
+                       'loss': total_loss / max(batch_count, 1)})
+        stats.put((rank, None))
+    except Exception as error:
+        stats.put((rank, repr(error)))
+
+
+def train_skipgram_hogwild(model, data_ids, epochs, dataset_params, n_workers=None, batch_size=512, lr=0.01,
+                           optimizer='sparse_adam', seed=0):
+    """
+    Обучение Skip-Gram на CPU в n_workers процессах по схеме Hogwild: веса модели лежат в общей памяти,
+    каждый процесс обучается на своем непересекающемся шарде документов data_ids (шарды примерно равны
+    по числу токенов) и обновляет общие веса без блокировок. Модель должна быть создана с sparse=True:
+    разреженные градиенты затрагивают только строки слов батча, поэтому процессы редко пишут в одни строки.
+    dataset_params: параметры SkipGramDataset для шардов (window_size, neg_samples, vocab_size, ...);
+        доли слов для прореживания считаются по всему корпусу, а не по шарду.
+    optimizer: 'sparse_adam' или 'sgd' (свой оптимизатор в каждом процессе).
+    Возвращает модель и отчет о скорости по процессам и эпохам (слова корпуса после прореживания в секунду).
+    """
+    if not model.center_emb.sparse:
+        raise ValueError("Для Hogwild нужна модель с разреженными градиентами: SkipGramNegSampling(..., sparse=True)")
+    n_workers = n_workers or os.cpu_count()
+    if not isinstance(data_ids, EncodedCorpus):
+        data_ids = EncodedCorpus.from_texts(data_ids)
+    dataset_params = dict(dataset_params)
+    if dataset_params.get('subsample', 1e-3) is not None and 'token_freq' not in dataset_params:
+        tokens = np.asarray(data_ids.tokens)
+        dataset_params['token_freq'] = np.bincount(tokens, minlength=dataset_params['vocab_size']) / max(len(tokens), 1)
+
+    # границы шардов - документы, на которые приходятся равные доли токенов
+    bounds = np.searchsorted(data_ids.offsets, np.linspace(0, data_ids.offsets[-1], n_workers + 1))
+    bounds[0], bounds[-1] = 0, len(data_ids)
+    model.share_memory()
+    # spawn: процессы не наследуют CUDA и другое состояние ноутбука, общие веса передаются через разделяемую память
+    context = mp.get_context('spawn')
+    stats = context.Queue()
+    workers = [context.Process(target=_hogwild_worker,
+                               args=(rank, model, data_ids[bounds[rank]:bounds[rank + 1]], dataset_params, epochs,
+                                     batch_size, lr, optimizer, seed, stats))
+               for rank in range(n_workers)]
+    for worker in workers:
+        worker.start()
+
+    rows, errors, finished = [], [], set()
+    try:
+        while len(finished) < n_workers:
+            try:
+                message = stats.get(timeout=5)
+            except queue.Empty:
+                # процесс, убитый без сообщения (например, по нехватке памяти), не пришлет сообщение о завершении - не ждем его вечно
+                dead = [rank for rank, worker in enumerate(workers)
+                        if rank not in finished and not worker.is_alive()]
+                if dead and stats.empty():
+                    raise RuntimeError(f"Процесс обучения {dead[0]} завершился с кодом {workers[dead[0]].exitcode}")
+                continue
+            if isinstance(message, dict):
+                rows.append(message)
+                print(f"Worker {message['worker']}, Epoch {message['epoch']}, Loss: {message['loss']:.4f}, "
+                      f"{message['words_per_sec']:.0f} слов/с")
+            else:
+                rank, error = message
+                finished.add(rank)
+                if error is not None:
+                    errors.append(error)
+    finally:
+        for worker in workers:
+            if worker.is_alive() and len(finished) < n_workers:
+                worker.terminate()
+            worker.join()
+    if errors:
+        raise RuntimeError(f"Ошибка в процессе обучения: {errors[0]}")
+    return model, pd.DataFrame(rows)
+
+
+# Параметры DataLoader: фоновые процессы загрузки - только при свободных ядрах
+LOADER_WORKERS = min(2, (os.cpu_count() or 1) - 1)
+
+
+def train_skipgram(model, dataset, epochs, batch_size=512, lr=0.01, device='cpu', max_batches=None,
+                   num_workers=None, pin_memory=None, history=None, verbose=True):
+    """
+    history: если передан список, в него добавляется loss каждого батча (кривая обучения).
+    num_workers, pin_memory: по умолчанию LOADER_WORKERS и закрепленная память только для CUDA.
+    """
+    device = torch.device(device)
+    if num_workers is None:
+        num_workers = LOADER_WORKERS
+    if pin_memory is None:
+        pin_memory = device.type == 'cuda'
+    model.to(device)
+    # датасет получает сразу список номеров батча и сам собирает тензоры (batch_size=None отключает collate)
+    loader = DataLoader(dataset, sampler=BatchSampler(RandomSampler(dataset), batch_size, drop_last=False),
+                        batch_size=None, num_workers=num_workers, pin_memory=pin_memory)
+    optimizer = Adam(model.parameters(), lr=lr)
+
+    for epoch in range(epochs):
+        if epoch > 0:
+            # новое прореживание и новые окна на каждой эпохе
+            dataset.resample()
+        model.train()
+        total_loss = 0
+        batch_count = 0
+
+        for i, batch in enumerate(loader):
+            if max_batches is not None and i >= max_batches:
+                break
+
+            centers, pos_contexts, neg_contexts = batch
+            centers = centers.to(device)
+            pos_contexts = pos_contexts.to(device)
+            neg_contexts = neg_contexts.to(device)
+
+            optimizer.zero_grad()
+            loss = model(centers, pos_contexts, neg_contexts)
+            loss.backward()
+            optimizer.step()
+
+            batch_loss = loss.item()
+            total_loss += batch_loss
+            batch_count += 1
+            if history is not None:
+                history.append(batch_loss)
+
+        if verbose:
+            print(f"Epoch {epoch+1}, Loss: {total_loss/batch_count:.4f}")
+
+    return model
+
+
+class WordEmbeddings:
+    def __init__(self, embedding_matrix, word2id):
+        """
+        embedding_matrix: numpy array, shape (vocab_size, emb_dim)
+        """
+        self.embeddings = embedding_matrix
+        # Нормируем для косинусного сходства
+        self.norms = np.linalg.norm(self.embeddings, axis=1, keepdims=True)
+        self.norms[self.norms == 0] = 1  # защита от деления на 0 для PAD
+        self.normed_emb = self.embeddings / self.norms
+        # масштабы строк, если normed_emb квантована в int8 (см. save/load)
+        self.scales = None
+
+        self.word2id = word2id
+        self.id2word = {v: k for k, v in word2id.items()}
+        # IVF-индекс для приближенного поиска соседей (строится по запросу, см. build_ivf_index)
+        self.ivf_centroids = None
+        self.ivf_ids = None
+        self.ivf_offsets = None
+
+    def word_id(self, word):
+        if word not in self.word2id:
+            raise KeyError(f"Слово '{word}' не найдено в словаре")
+        return self.word2id[word]
+
+    def get_vector(self, word):
+        return self.vectors(self.word_id(word))
+
+    def vectors(self, ids):
+        """Исходные (ненормированные) векторы слов по их ID."""
+        if self.embeddings is not None:
+            return self.embeddings[ids]
+        # у загруженного хранилища векторы восстанавливаются из нормированных и норм
+        return self.normed_rows(ids) * self.norms[ids]
+
+    def normed_rows(self, ids=slice(None)):
+        """Нормированные векторы слов в float32 (строки квантованной матрицы деквантуются)."""
+        rows = np.asarray(self.normed_emb[ids], dtype=np.float32)
+        if self.scales is not None:
+            rows = rows * self.scales[ids][..., None]
+        return rows
+
+    def save(self, path, dtype='float16'):
+        """
+        Сохраняет эмбеддинги в директорию path: словарь (vocab.txt, слова в порядке ID), нормированную
+        матрицу normed.npy в dtype ('float32', 'float16' или 'int8' с масштабом на строку в scales.npy)
+        и нормы векторов norms.npy, по которым восстанавливаются исходные векторы.
+        """
+        if dtype not in ('float32', 'float16', 'int8'):
+            raise ValueError(f"Неподдерживаемый тип: {dtype}")
+        os.makedirs(path, exist_ok=True)
+        normed = self.normed_rows()
+        if dtype == 'int8':
+            scales = np.abs(normed).max(axis=1) / 127
+            scales[scales == 0] = 1
+            np.save(os.path.join(path, 'scales.npy'), scales.astype(np.float32))
+            normed = np.round(normed / scales[:, None])
+        elif os.path.exists(os.path.join(path, 'scales.npy')):
+            os.remove(os.path.join(path, 'scales.npy'))
+        np.save(os.path.join(path, 'normed.npy'), normed.astype(dtype))
+        np.save(os.path.join(path, 'norms.npy'), np.asarray(self.norms, dtype=np.float32).ravel())
+        with open(os.path.join(path, 'vocab.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.id2word[i] for i in range(len(self.id2word))))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Загружает эмбеддинги, сохраненные save. При mmap=True матрица отображается в память
+        (np.load(mmap_mode='r')): загрузка почти мгновенна, а процессы, открывшие один файл,
+        делят его страницы. Сходства считаются прямо по квантованной матрице.
+        """
+        mmap_mode = 'r' if mmap else None
+        with open(os.path.join(path, 'vocab.txt'), encoding='utf-8') as f:
+            words = f.read().split('\n')
+        emb = cls.__new__(cls)
+        emb.embeddings = None
+        emb.normed_emb = np.load(os.path.join(path, 'normed.npy'), mmap_mode=mmap_mode)
+        emb.norms = np.load(os.path.join(path, 'norms.npy'), mmap_mode=mmap_mode)[:, None]
+        scales_path = os.path.join(path, 'scales.npy')
+        emb.scales = np.load(scales_path, mmap_mode=mmap_mode) if os.path.exists(scales_path) else None
+        emb.word2id = {word: i for i, word in enumerate(words)}
+        emb.id2word = dict(enumerate(words))
+        emb.ivf_centroids = None
+        emb.ivf_ids = None
+        emb.ivf_offsets = None
+        return emb
+
+    def avg_similarity(self, word_list):
+        "Возвращает среднее мер косинусного сходства для списка слов (вычисляется попарно)"
+        ids = [self.word_id(word) for word in word_list]
+        if len(ids) < 2:
+            return 0
+        # матрица Грама нормированных векторов: все попарные косинусы одним умножением
+        vectors = self.normed_rows(ids)
+        gram = vectors @ vectors.T
+        return np.mean(gram[np.triu_indices(len(ids), k=1)])
+
+    def top_k(self, vectors, k=10, exclude=None, n_probe=None, batch_size=16384):
+        """
+        Находит k ближайших по косинусной мере слов для каждого вектора-запроса.
+        vectors: (emb_dim,) или (n, emb_dim); exclude: для каждого запроса ID слов, которые не возвращать.
+        n_probe: если задан, поиск приближенный по IVF-индексу (см. build_ivf_index) - просматриваются
+            только n_probe ближайших кластеров: больше кластеров - выше полнота, но медленнее поиск.
+        Возвращает матрицы ID слов (n, k) и сходств (n, k), строки отсортированы по убыванию сходства
+        (если кандидатов меньше k, хвост строки заполнен ID -1 со сходством -inf).
+        """
+        vectors = np.atleast_2d(vectors).astype(np.float32)
+        queries = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-8)
+        if exclude is None:
+            exclude = [()] * len(queries)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+
+        if n_probe is None:
+            # точный поиск: словарь просматривается блоками по batch_size строк (квантованная матрица
+            # деквантуется поблочно), лучшие k блока сливаются с лучшими k предыдущих блоков
+            excluded_rows = np.repeat(np.arange(len(queries)), [len(excluded) for excluded in exclude])
+            excluded_ids = np.fromiter(chain.from_iterable(exclude), dtype=np.int64, count=len(excluded_rows))
+            for start in range(0, len(self.normed_emb), batch_size):
+                block = queries @ self.normed_rows(slice(start, start + batch_size)).T
+                in_block = (excluded_ids >= start) & (excluded_ids < start + batch_size)
+                block[excluded_rows[in_block], excluded_ids[in_block] - start] = -np.inf
+                block_ids = self._select_top_k(block, k)
+                candidate_ids = np.concatenate([ids, block_ids + start], axis=1)
+                candidate_scores = np.concatenate([scores, np.take_along_axis(block, block_ids, axis=1)], axis=1)
+                best = self._select_top_k(candidate_scores, k)
+                ids = np.take_along_axis(candidate_ids, best, axis=1)
+                scores = np.take_along_axis(candidate_scores, best, axis=1)
+        else:
+            if self.ivf_centroids is None:
+                raise ValueError("IVF-индекс не построен: вызовите build_ivf_index()")
+            n_probe = min(n_probe, len(self.ivf_centroids))
+            probes = self._select_top_k(queries @ self.ivf_centroids.T, n_probe)
+            for row, query in enumerate(queries):
+                candidates = np.concatenate([self.ivf_ids[self.ivf_offsets[c]:self.ivf_offsets[c + 1]]
+                                             for c in probes[row]])
+                candidate_scores = self.normed_rows(candidates) @ query
+                candidate_scores[np.isin(candidates, list(exclude[row]))] = -np.inf
+                best = self._select_top_k(candidate_scores[None], k)[0]
+                ids[row, :len(best)] = candidates[best]
+                scores[row, :len(best)] = candidate_scores[best]
+
+        # исключенные слова могли попасть в хвост строки, если кандидатов меньше k
+        ids[np.isneginf(scores)] = -1
+        return ids, scores
+
+    @staticmethod
+    def _select_top_k(scores, k):
+        """Столбцы k наибольших значений каждой строки по убыванию: argpartition за O(n), сортируются только k."""
+        if k < scores.shape[1]:
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+        order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind='stable')
+        return np.take_along_axis(part, order, axis=1)
+
+    def build_ivf_index(self, n_lists=None, n_iter=10, seed=0, batch_size=65536):
+        """
+        Строит IVF-индекс для приближенного поиска соседей: нормированные векторы кластеризуются
+        сферическим k-means на n_lists кластеров (по умолчанию ~sqrt(размера словаря)),
+        для каждого кластера хранится список его слов (ivf_ids, границы списков - ivf_offsets).
+        """
+        rng = np.random.default_rng(seed)
+        X = self.normed_rows()
+        n_lists = min(n_lists or max(1, int(np.sqrt(len(X)))), len(X))
+        centroids = X[rng.choice(len(X), n_lists, replace=False)].copy()
+
+        def assign(centroids):
+            return np.concatenate([np.argmax(X[start:start + batch_size] @ centroids.T, axis=1)
+                                   for start in range(0, len(X), batch_size)])
+
+        for _ in range(n_iter):
+            labels = assign(centroids)
+            order = np.argsort(labels, kind='stable')
+            counts = np.bincount(labels, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            nonempty = counts > 0
+            sums[nonempty] = np.add.reduceat(X[order], (np.cumsum(counts) - counts)[nonempty], axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # пустые кластеры получают случайные слова в качестве новых центров
+            empty = norms[:, 0] == 0
+            sums[empty] = X[rng.choice(len(X), empty.sum())]
+            norms[empty] = 1
+            centroids = sums / norms
+
+        labels = assign(centroids)
+        self.ivf_centroids = centroids
+        self.ivf_ids = np.argsort(labels, kind='stable')
+        self.ivf_offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=n_lists))])
+        return self
+
+    def most_similar(self, word, k=10, n_probe=None):
+        """Возвращает k самых близких слов по косинусной мере."""
+        return self.most_similar_many([word], k, n_probe)[0]
+
+    def most_similar_many(self, words, k=10, n_probe=None):
+        """Соседи для списка слов одним матричным запросом: для каждого слова - k пар (слово, сходство)."""
+        if not words:
+            return []
+        word_ids = [self.word_id(word) for word in words]
+        ids, scores = self.top_k(self.vectors(word_ids), k, exclude=[[i] for i in word_ids], n_probe=n_probe)
+        return [[(self.id2word[idx], score) for idx, score in zip(row_ids, row_scores) if idx >= 0]
+                for row_ids, row_scores in zip(ids, scores)]
+
+    def analogy(self, word_a, word_b, word_c, k=5, n_probe=None):
+        """Решает пропорцию: word_a относится к word_b так же, как word_c относится к ?."""
+        # vec_a - vec_b + vec_c
+        vec = self.get_vector(word_a) - self.get_vector(word_b) + self.get_vector(word_c)
+        # Исключаем исходные слова из результата
+        exclude_ids = [self.word2id[w] for w in [word_a, word_b, word_c]]
+        ids, scores = self.top_k(vec, k, exclude=[exclude_ids], n_probe=n_probe)
+        return [(self.id2word[idx], score) for idx, score in zip(ids[0], scores[0]) if idx >= 0]
+
+    def evaluate_analogies(self, analogies, k=10, n_probe=None, batch_size=1024):
+        """
+        Оценивает аналогии пакетно. analogies - путь к файлу или список строк в формате word2vec
+        questions-words: "a b c d" (a относится к b так же, как c к d), строки ": раздел" задают разделы.
+        Ответ ищется как b - a + c (как analogy(b, a, c)) среди всех слов, кроме a, b и c.
+        Строки со словами вне словаря пропускаются. Возвращает DataFrame по разделам (и итог 'all'):
+        число аналогий, число покрытых словарем и accuracy@1 / accuracy@k.
+        """
+        if isinstance(analogies, str):
+            with open(analogies, encoding='utf-8') as f:
+                analogies = f.readlines()
+
+        section = 'all'
+        sections, rows, total = [], [], defaultdict(int)
+        for line in analogies:
+            line = line.strip().lower()
+            if not line:
+                continue
+            if line.startswith(':'):
+                section = line[1:].strip()
+                continue
+            words = line.split()
+            total[section] += 1
+            if len(words) == 4 and all(word in self.word2id for word in words):
+                sections.append(section)
+                rows.append([self.word2id[word] for word in words])
+
+        rows = np.array(rows, dtype=np.int64).reshape(-1, 4)
+        hits = np.zeros((len(rows), k), dtype=bool)
+        for start in range(0, len(rows), batch_size):
+            a, b, c, d = rows[start:start + batch_size].T
+            vectors = self.vectors(b) - self.vectors(a) + self.vectors(c)
+            ids, _ = self.top_k(vectors, k, exclude=np.stack([a, b, c], axis=1), n_probe=n_probe)
+            hits[start:start + batch_size] = ids == d[:, None]
+
+        found = pd.DataFrame({'section': sections, 'accuracy@1': hits[:, 0], f'accuracy@{k}': hits.any(axis=1)})
+        if set(total) != {'all'}:
+            # итоговая строка по всем разделам
+            found = pd.concat([found, found.assign(section='all')])
+            total['all'] = sum(total.values())
+        by_section = found.groupby('section', sort=False)
+        report = by_section[['accuracy@1', f'accuracy@{k}']].mean().reindex(list(total))
+        report.insert(0, 'covered', by_section.size().reindex(list(total)).fillna(0).astype(int))
+        report.insert(0, 'total', [total[section] for section in report.index])
+        return report
+
+
+_sweep_datasets = {}
+
+
+_sweep_word2id = {}
+
+
+def _init_sweep_worker(datasets, word2id, n_threads):
+    """Инициализирует процесс пула перебора: датасеты по размерам окна и словарь передаются один раз на процесс."""
+    global _sweep_datasets, _sweep_word2id
+    _sweep_datasets = datasets
+    _sweep_word2id = word2id
+    torch.set_num_threads(n_threads)
+
+
+def _sweep_point(window_size, emb_dim, vocab_size, epochs, batch_size, max_batches, eval_words, analogies, seed,
+                 device='cpu'):
+    """Обучает Skip-Gram для одной точки сетки и считает метрики; возвращает строку таблицы и эмбеддинги."""
+    torch.manual_seed(seed)
+    # своя копия состояния датасета: resample не должен зависеть от того, какие точки уже прошли в процессе
+    dataset = copy.copy(_sweep_datasets[window_size])
+    dataset.rng = np.random.default_rng(seed)
+    history = []
+    start = time.perf_counter()
+    model = SkipGramNegSampling(vocab_size, emb_dim)
+    model = train_skipgram(model, dataset, epochs=epochs, batch_size=batch_size, max_batches=max_batches,
+                           device=device, num_workers=0, pin_memory=False, history=history, verbose=False)
+    seconds = time.perf_counter() - start
+    embedding_matrix = model.center_emb.weight.detach().cpu().numpy()
+    emb = WordEmbeddings(embedding_matrix, _sweep_word2id)
+    row = {'window_size': window_size, 'emb_dim': emb_dim, 'pairs': len(dataset), 'seconds': seconds,
+           'final_loss': np.mean(history[-50:]), 'loss_curve': history,
+           'avg_similarity': emb.avg_similarity(eval_words)}
+    if analogies is not None:
+        report = emb.evaluate_analogies(analogies, k=10)
+        row['analogies_total'] = report.at['all', 'total']
+        row['analogies_covered'] = report.at['all', 'covered']
+        row['accuracy@1'] = report.at['all', 'accuracy@1']
+        row['accuracy@10'] = report.at['all', 'accuracy@10']
+    return row, embedding_matrix
+
+
+def run_sweep(data_ids, word2id, window_sizes, emb_dims, dataset_params, eval_words, analogies=None, epochs=1,
+              batch_size=512, max_batches=None, n_jobs=None, seed=0, device='cpu'):
+    """
+    Перебор сетки window_sizes x emb_dims для Skip-Gram в пуле из n_jobs процессов (по умолчанию -
+    по числу ядер; ядра делятся между процессами поровну). Датасет строится один раз на размер окна
+    в основном процессе и передается каждому процессу пула (spawn) при его запуске.
+    На CUDA точки обучаются по очереди в основном процессе: процессы пула делили бы одну GPU,
+    каждый со своим контекстом CUDA.
+    word2id: словарь для оценки эмбеддингов (WordEmbeddings).
+    dataset_params: остальные параметры SkipGramDataset (neg_samples, vocab_size, word_freq, subsample, ...).
+    Возвращает таблицу результатов (индекс - window_size, emb_dim; кривые loss по батчам, среднее сходство
+    eval_words, точность на аналогиях, время обучения) и словарь эмбеддингов точек сетки.
+    """
+    n_cores = os.cpu_count()
+    n_jobs = min(n_jobs or n_cores, len(window_sizes) * len(emb_dims))
+    datasets = {window_size: SkipGramDataset(data_ids, window_size, seed=seed, **dataset_params)
+                for window_size in window_sizes}
+    vocab_size = dataset_params['vocab_size']
+    grid = [(window_size, emb_dim) for window_size in window_sizes for emb_dim in emb_dims]
+
+    rows, embeddings = [], {}
+    device = torch.device(device)
+    point_args = [(window_size, emb_dim, vocab_size, epochs, batch_size, max_batches, eval_words, analogies, seed,
+                   device) for window_size, emb_dim in grid]
+    if device.type == 'cuda':
+        _init_sweep_worker(datasets, word2id, torch.get_num_threads())
+        results = [_sweep_point(*args) for args in point_args]
+    else:
+        context = mp.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context, initializer=_init_sweep_worker,
+                                 initargs=(datasets, word2id, max(1, n_cores // n_jobs))) as pool:
+            results = [future.result() for future in [pool.submit(_sweep_point, *args) for args in point_args]]
+    for row, embedding_matrix in results:
+        rows.append(row)
+        embeddings[row['window_size'], row['emb_dim']] = embedding_matrix
+    return pd.DataFrame(rows).set_index(['window_size', 'emb_dim']), embeddings
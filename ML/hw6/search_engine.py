@@ -0,0 +1,1879 @@
+import heapq
+import json
+import os
+import time
+import multiprocessing as mp
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from itertools import chain, islice
+from math import log
+from urllib.parse import urlparse
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+
+class MappedPostings(Mapping):
+    '''Обратный индекс {слово: (слоты документов, TF, позиции)} только для чтения:
+        срезы плоских массивов загруженного с диска индекса (без копирования при mmap)'''
+    def __init__(self, terms, offsets, docs, tfs, position_offsets, positions):
+        self._term_ids = {term: i for i, term in enumerate(terms)}
+        self._offsets = offsets
+        self._docs = docs
+        self._tfs = tfs
+        self._position_offsets = position_offsets
+        self._positions = positions
+
+    def __getitem__(self, word):
+        i = self._term_ids[word]
+        start, end = self._offsets[i], self._offsets[i + 1]
+        pos_start, pos_end = self._position_offsets[i], self._position_offsets[i + 1]
+        return self._docs[start:end], self._tfs[start:end], self._positions[pos_start:pos_end]
+
+    def __contains__(self, word):
+        return word in self._term_ids
+
+    def __iter__(self):
+        return iter(self._term_ids)
+
+    def __len__(self):
+        return len(self._term_ids)
+
+    def doc_freq(self):
+        '''Документные частоты слов (длины их постингов)'''
+        return dict(zip(self._term_ids, np.diff(self._offsets).tolist()))
+
+
+class SearchEngine:
+    '''Класс для поиска веб-страниц по запросу
+        на основе алгоритмов PageRank, BM25 и TF-IDF'''
+    def __init__(self, cache_size=1024, cache_ttl=None):
+        '''cache_size - число запросов в LRU-кэше результатов search (0 - без кэша),
+            cache_ttl - время жизни записи кэша в секундах (None - без ограничения)'''
+        self.pages = {}
+        # обратный индекс: слово -> (отсортированные слоты документов int32, TF uint16,
+        # позиции слова int32 подряд для каждого документа - по TF штук)
+        self.inverted_index = {}
+        self.tfidf_matrix = None
+        self.tfidf_vectorizer = None
+        self.pagerank = {}
+        self.pagerank_vector = np.zeros(0)
+        self.pagerank_report = {}
+        self.doc_freq = defaultdict(int)
+        self.total_docs = 0
+        # слоты документов: позиция страницы во всех массивах индекса (у удаленных страниц - None)
+        self.doc_ids = []
+        self.doc_index = {}
+        self._lengths = np.zeros(0)
+        self.doc_lengths = self._lengths[:0]
+        self.avg_doc_len = 0.0
+        self._total_doc_len = 0
+        # изменения постингов копятся и применяются к массивам лениво перед запросом,
+        # IDF и вклады слов в BM25 досчитываются при изменении статистик коллекции
+        self.idf = {}
+        self.bm25_impacts = {}
+        self.bm25_upper_bounds = {}
+        self._pending_postings = defaultdict(list)
+        self._removed_postings = defaultdict(set)
+        # постинги пакетов ingest: куски массивов, дописываемые в конец постингов слова
+        self._appended_postings = defaultdict(list)
+        self._bm25_stats_key = None
+        self._indexed = False
+        # инкрементальный TF-IDF: словарь, документные частоты и счетчики слов по слотам
+        self.tfidf_vocabulary = {}
+        self.tfidf_doc_freq = []
+        self.tfidf_idf = np.zeros(0)
+        self.tfidf_matrix_csc = None
+        self.tfidf_upper_bounds = np.zeros(0)
+        self._tfidf_rows = {}
+        self._tfidf_dirty = False
+        # параметры последнего расчета PageRank (для ленивого пересчета с теплым стартом)
+        self._pagerank_params = None
+        self._pagerank_dirty = False
+        # тематический PageRank: векторы тем - столбцы матрицы (слоты x темы), центроиды тем - в TF-IDF
+        self.topic_names = []
+        self.topic_pagerank_matrix = np.zeros((0, 0))
+        self.topic_centroids = None
+        self.topic_pagerank_report = {}
+        self._topic_pagerank_params = None
+        self._topic_pagerank_dirty = False
+        # индекс, загруженный с диска, материализуется в памяти только при первом изменении
+        self._lazy_loaded = False
+        self._tfidf_loaded_counts = None
+        # статистики всей коллекции, если движок - шард ShardedSearchEngine (иначе считаются локально)
+        self.collection_stats = None
+        # кэш результатов поиска: записи прошлых поколений индекса считаются устаревшими
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.generation = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._result_cache = OrderedDict()
+        # слоты существующих страниц, посчитанные для поколения индекса _live_generation
+        self._live = np.zeros(0, dtype=np.int64)
+        self._live_generation = None
+
+    def add_page(self, page):
+        '''Добавляет в индекс веб-страницу (словарь с атрибутами url, title, content, outgoing_links).
+            Если индекс уже построен, страница индексируется инкрементально'''
+        if page['id'] in self.pages:
+            self.update_page(page)
+            return
+        self.pages[page['id']] = {
+            'url': page['url'],
+            'title': page['title'],
+            'content': page['content'],
+            'outgoing_links': page['outgoing_links']
+        }
+        slot = len(self.doc_ids)
+        self.doc_ids.append(page['id'])
+        self.doc_index[page['id']] = slot
+        if slot >= len(self._lengths):
+            # буфер длин растет вдвое, чтобы добавление страницы было амортизированно O(1)
+            lengths = np.zeros(max(slot + 1, 2 * len(self._lengths)))
+            lengths[:len(self._lengths)] = self._lengths
+            self._lengths = lengths
+        self.doc_lengths = self._lengths[:len(self.doc_ids)]
+        self.total_docs = len(self.pages)
+        self._index_page(slot)
+
+    def update_page(self, page):
+        '''Обновляет страницу: старые постинги удаляются, новые добавляются на месте'''
+        if page['id'] not in self.pages:
+            self.add_page(page)
+            return
+        slot = self.doc_index[page['id']]
+        self._unindex_page(slot)
+        self.pages[page['id']] = {
+            'url': page['url'],
+            'title': page['title'],
+            'content': page['content'],
+            'outgoing_links': page['outgoing_links']
+        }
+        self._index_page(slot)
+
+    def delete_page(self, doc_id):
+        '''Удаляет страницу из индекса (ее слот остается пустым)'''
+        slot = self.doc_index[doc_id]
+        self._unindex_page(slot)
+        del self.pages[doc_id]
+        del self.doc_index[doc_id]
+        self.doc_ids[slot] = None
+        self.total_docs = len(self.pages)
+        self.avg_doc_len = self._total_doc_len / self.total_docs if self.total_docs else 0.0
+        self._mark_pagerank_dirty()
+
+    def ingest(self, paths, batch_size=1000, n_jobs=None, keep_content=False, verbose=False):
+        '''Потоковая загрузка страниц из JSONL/HTML-файлов с токенизацией в пуле из n_jobs процессов
+            (keep_content=False - без хранения текстов), возвращает отчет о пропускной способности'''
+        if not self._indexed:
+            self.build_inverted_index()
+        if self.tfidf_vectorizer is None:
+            self.compute_tfidf_vectors()
+        n_jobs = n_jobs or os.cpu_count()
+        records = iter_page_records(paths)
+        batches = iter(lambda: list(islice(records, batch_size)), [])
+        report = {'pages': 0, 'batches': 0, 'seconds': 0.0, 'pages_per_sec': 0.0}
+        start = time.perf_counter()
+
+        def index_batch(chunks):
+            for chunk in chunks:
+                self._add_tokenized_pages(chunk)
+                report['pages'] += len(chunk['pages'])
+            report['batches'] += 1
+            report['seconds'] = time.perf_counter() - start
+            report['pages_per_sec'] = report['pages'] / report['seconds'] if report['seconds'] else 0.0
+            if verbose:
+                print(f"{report['pages']} страниц, {report['pages_per_sec']:.0f} страниц/с")
+
+        if n_jobs == 1:
+            for batch in batches:
+                index_batch([_tokenize_pages(batch, keep_content, self._tfidf_analyzer)])
+            return report
+
+        context = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context, initializer=_init_ingest_worker,
+                                 initargs=(self._tfidf_analyzer,)) as pool:
+            def submit(batch):
+                chunk = -(-len(batch) // n_jobs)
+                return [pool.submit(_tokenize_pages, batch[i:i + chunk], keep_content)
+                        for i in range(0, len(batch), chunk)]
+
+            # пока индексируется текущий пакет, пул уже разбирает следующий
+            in_progress = None
+            for batch in batches:
+                submitted = submit(batch)
+                if in_progress is not None:
+                    index_batch(future.result() for future in in_progress)
+                in_progress = submitted
+            if in_progress is not None:
+                index_batch(future.result() for future in in_progress)
+        return report
+
+    def _add_tokenized_pages(self, chunk):
+        '''Добавляет в индекс пакет страниц, разобранный _tokenize_pages'''
+        self.generation += 1
+        if self._lazy_loaded:
+            self._materialize_loaded_index()
+        pages = chunk['pages']
+        # повторный id заменяет страницу: старая версия удаляется, из пакета берется последняя
+        last = {page['id']: i for i, page in enumerate(pages)}
+        keep = np.zeros(len(pages), dtype=bool)
+        keep[list(last.values())] = True
+        for doc_id in last:
+            if doc_id in self.pages:
+                self.delete_page(doc_id)
+        if self._pending_postings or self._removed_postings:
+            self._merge_pending_postings()
+
+        kept = np.flatnonzero(keep)
+        first_slot = len(self.doc_ids)
+        page_slots = np.zeros(len(pages), dtype=np.int32)
+        page_slots[kept] = np.arange(first_slot, first_slot + len(kept), dtype=np.int32)
+        for i in kept:
+            page = pages[i]
+            self.pages[page['id']] = {key: value for key, value in page.items() if key != 'id'}
+            self.doc_index[page['id']] = len(self.doc_ids)
+            self.doc_ids.append(page['id'])
+        n_slots = len(self.doc_ids)
+        if n_slots > len(self._lengths):
+            lengths = np.zeros(max(n_slots, 2 * len(self._lengths)))
+            lengths[:len(self._lengths)] = self._lengths
+            self._lengths = lengths
+        self.doc_lengths = self._lengths[:n_slots]
+        self.doc_lengths[first_slot:] = chunk['lengths'][kept]
+        self._total_doc_len += int(chunk['lengths'][kept].sum())
+        self.total_docs = len(self.pages)
+        self.avg_doc_len = self._total_doc_len / self.total_docs if self.total_docs else 0.0
+
+        term_offsets, position_offsets = chunk['term_offsets'], chunk['position_offsets']
+        docs, tfs, positions = chunk['docs'], chunk['tfs'], chunk['positions']
+        if not keep.all():
+            posting_keep = keep[docs]
+            positions = positions[np.repeat(posting_keep, tfs)]
+            term_offsets = np.concatenate([[0], np.cumsum(posting_keep)])[term_offsets]
+            position_offsets = np.concatenate([[0], np.cumsum(tfs[posting_keep], dtype=np.int64)])[term_offsets]
+            docs, tfs = docs[posting_keep], tfs[posting_keep]
+        posting_slots = page_slots[docs]
+        for i, word in enumerate(chunk['terms']):
+            start, end = term_offsets[i], term_offsets[i + 1]
+            if start == end:
+                continue
+            self.doc_freq[word] += int(end - start)
+            appended = self._appended_postings[word]
+            appended.append((posting_slots[start:end], tfs[start:end],
+                             positions[position_offsets[i]:position_offsets[i + 1]]))
+            # частые слова сливаются с массивами заранее, чтобы не копить мелкие куски
+            if len(appended) >= 32:
+                self._merge_appended_postings(word)
+            self.idf.pop(word, None)
+            self.bm25_impacts.pop(word, None)
+            self.bm25_upper_bounds.pop(word, None)
+
+        columns = np.empty(len(chunk['tfidf_terms']), dtype=np.int32)
+        for i, term in enumerate(chunk['tfidf_terms']):
+            col = self.tfidf_vocabulary.get(term)
+            if col is None:
+                col = len(self.tfidf_vocabulary)
+                self.tfidf_vocabulary[term] = col
+                self.tfidf_doc_freq.append(0)
+            columns[i] = col
+        indptr, counts = chunk['tfidf_indptr'], chunk['tfidf_counts']
+        cols = columns[chunk['tfidf_indices']]
+        # столбцы сортируются внутри каждой строки одной сортировкой по паре (страница, столбец)
+        rows = np.repeat(np.arange(len(pages)), np.diff(indptr))
+        order = np.lexsort((cols, rows))
+        cols, counts = cols[order], counts[order]
+        for i in kept:
+            self._tfidf_rows[int(page_slots[i])] = (cols[indptr[i]:indptr[i + 1]], counts[indptr[i]:indptr[i + 1]])
+        for col, count in zip(*np.unique(cols[keep[rows]], return_counts=True)):
+            self.tfidf_doc_freq[col] += int(count)
+        self._tfidf_dirty = True
+        self._mark_pagerank_dirty()
+
+    def _mark_pagerank_dirty(self):
+        '''После изменения страниц посчитанные векторы PageRank пересчитываются перед следующим поиском'''
+        if self._pagerank_params is not None:
+            self._pagerank_dirty = True
+        if self._topic_pagerank_params is not None:
+            self._topic_pagerank_dirty = True
+
+    def _index_page(self, slot):
+        self.generation += 1
+        if self._lazy_loaded:
+            self._materialize_loaded_index()
+        if self._indexed:
+            self._index_terms(slot)
+        if self.tfidf_vectorizer is not None:
+            self._index_tfidf_terms(slot)
+        self._mark_pagerank_dirty()
+
+    def _unindex_page(self, slot):
+        self.generation += 1
+        if self._lazy_loaded:
+            self._materialize_loaded_index()
+        if self._indexed:
+            self._unindex_terms(slot)
+        if self.tfidf_vectorizer is not None:
+            self._unindex_tfidf_terms(slot)
+
+    def _index_terms(self, slot):
+        '''Добавляет постинги страницы в обратный индекс'''
+        doc_id = self.doc_ids[slot]
+        words = self.pages[doc_id]['content'].lower().split()
+        word_positions = defaultdict(list)
+        for position, word in enumerate(words):
+            word_positions[word].append(position)
+
+        for word, positions in word_positions.items():
+            self.doc_freq[word] += 1
+            # TF хранится в uint16, поэтому позиций у слова в документе не больше 65535
+            self._pending_postings[word].append((slot, positions[:65535]))
+
+        self.doc_lengths[slot] = len(words)
+        self._total_doc_len += len(words)
+        self.avg_doc_len = self._total_doc_len / self.total_docs
+
+    def _unindex_terms(self, slot):
+        '''Удаляет постинги страницы из обратного индекса'''
+        page = self.pages[self.doc_ids[slot]]
+        # у страниц, загруженных без текста, хранится список их слов
+        words = page['terms'] if page['content'] is None else set(page['content'].lower().split())
+        for word in words:
+            self.doc_freq[word] -= 1
+            if not self.doc_freq[word]:
+                del self.doc_freq[word]
+            if word in self._pending_postings:
+                self._pending_postings[word] = [posting for posting in self._pending_postings[word]
+                                                if posting[0] != slot]
+            self._removed_postings[word].add(slot)
+
+        self._total_doc_len -= self.doc_lengths[slot]
+        self.doc_lengths[slot] = 0
+
+    def _check_contents(self):
+        '''Полная перестройка индексов токенизирует тексты заново, поэтому они должны храниться'''
+        if any(page['content'] is None for page in self.pages.values()):
+            raise ValueError("Тексты страниц не сохранены (ingest с keep_content=False): "
+                             "индекс можно только дополнять")
+
+    @staticmethod
+    def _postings_arrays(docs_words):
+        '''Постинги набора документов (списков слов) плоскими массивами: слова, длины документов,
+            границы постингов, документы, TF, границы позиций и позиции'''
+        lengths = np.array([len(words) for words in docs_words], dtype=np.int64)
+        n_tokens = int(lengths.sum())
+        vocabulary = {}
+        term_ids = np.fromiter((vocabulary.setdefault(word, len(vocabulary))
+                                for words in docs_words for word in words),
+                               dtype=np.int64, count=n_tokens)
+        # stable-сортировка по слову сохраняет порядок документов и позиций внутри слова
+        order = np.argsort(term_ids, kind='stable')
+        token_terms = term_ids[order]
+        token_docs = np.repeat(np.arange(len(docs_words), dtype=np.int32), lengths)[order]
+        token_positions = (np.arange(n_tokens) - np.repeat(np.cumsum(lengths) - lengths, lengths))[order]
+
+        # постинг начинается там, где меняется пара (слово, документ)
+        is_start = np.ones(n_tokens, dtype=bool)
+        is_start[1:] = (token_terms[1:] != token_terms[:-1]) | (token_docs[1:] != token_docs[:-1])
+        starts = np.flatnonzero(is_start)
+        tfs = np.diff(np.append(starts, n_tokens))
+        if len(tfs) and tfs.max() > 65535:
+            # TF хранится в uint16: у слова в документе остаются первые 65535 позиций
+            keep = np.arange(n_tokens) - np.repeat(starts, tfs) < 65535
+            token_positions = token_positions[keep]
+            tfs = np.minimum(tfs, 65535)
+
+        term_offsets = np.searchsorted(token_terms[starts], np.arange(len(vocabulary) + 1))
+        position_offsets = np.concatenate([[0], np.cumsum(tfs)])[term_offsets]
+        return (list(vocabulary), lengths, term_offsets, token_docs[starts], tfs.astype(np.uint16),
+                position_offsets, token_positions.astype(np.int32))
+
+    def build_inverted_index(self):
+        '''Строит обратный индекс, возвращает список документов с TF'''
+        self._check_contents()
+        self.generation += 1
+        if self._lazy_loaded:
+            self._materialize_loaded_index()
+        self.inverted_index = {}
+        self.doc_freq.clear()
+        self.idf.clear()
+        self.bm25_impacts.clear()
+        self.bm25_upper_bounds.clear()
+        self._pending_postings.clear()
+        self._removed_postings.clear()
+        self._appended_postings.clear()
+        self.total_docs = len(self.pages)
+
+        slots = np.array([slot for slot, doc_id in enumerate(self.doc_ids) if doc_id is not None], dtype=np.int32)
+        docs_words = [self.pages[self.doc_ids[slot]]['content'].lower().split() for slot in slots]
+        words, lengths, term_offsets, docs, tfs, position_offsets, positions = self._postings_arrays(docs_words)
+        self.doc_lengths[:] = 0
+        self.doc_lengths[slots] = lengths
+        self._total_doc_len = int(lengths.sum())
+        self.avg_doc_len = self._total_doc_len / self.total_docs if self.total_docs else 0.0
+
+        posting_slots = slots[docs]
+        for i, word in enumerate(words):
+            start, end = term_offsets[i], term_offsets[i + 1]
+            self.inverted_index[word] = (posting_slots[start:end], tfs[start:end],
+                                         positions[position_offsets[i]:position_offsets[i + 1]])
+            self.doc_freq[word] = int(end - start)
+
+        self._indexed = True
+        self._refresh_index()
+
+    def _refresh_index(self):
+        '''Лениво обновляет производные структуры: массивы постингов измененных слов,
+            кэш IDF/вкладов BM25 и матрицу TF-IDF'''
+        self._merge_pending_postings()
+
+        # IDF и нормировка длины зависят от размера коллекции и средней длины документа
+        stats_key = self._collection_size_and_avg_len()
+        if stats_key != self._bm25_stats_key:
+            self.idf.clear()
+            self.bm25_impacts.clear()
+            self.bm25_upper_bounds.clear()
+            self._bm25_stats_key = stats_key
+
+        if self._tfidf_dirty:
+            self._refresh_tfidf()
+
+    def _merge_pending_postings(self):
+        '''Применяет накопленные изменения постингов к их массивам'''
+        # сначала к массивам дописываются куски пакетов ingest, затем убираются удаленные слоты
+        # и дописываются новые постинги отдельных страниц
+        for word in list(self._appended_postings):
+            self._merge_appended_postings(word)
+        empty = (np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint16), np.zeros(0, dtype=np.int32))
+        for word in self._removed_postings.keys() | self._pending_postings.keys():
+            doc_idx, tfs, positions = self.inverted_index.get(word, empty)
+            removed = self._removed_postings.get(word)
+            if removed:
+                keep = ~np.isin(doc_idx, np.fromiter(removed, dtype=np.int32))
+                positions = positions[np.repeat(keep, tfs)]
+                doc_idx, tfs = doc_idx[keep], tfs[keep]
+            added = self._pending_postings.get(word)
+            if added:
+                doc_idx = np.concatenate([doc_idx, np.array([slot for slot, _ in added], dtype=np.int32)])
+                tfs = np.concatenate([tfs, np.array([len(pos) for _, pos in added], dtype=np.uint16)])
+                new_positions = np.fromiter(chain.from_iterable(pos for _, pos in added), dtype=np.int32)
+                positions = np.concatenate([positions, new_positions])
+                if np.any(np.diff(doc_idx) < 0):
+                    order = np.argsort(doc_idx, kind='stable')
+                    starts = np.cumsum(tfs, dtype=np.int64) - tfs
+                    positions = positions[self._gather_ranges(starts[order], tfs[order])]
+                    doc_idx, tfs = doc_idx[order], tfs[order]
+            if len(doc_idx):
+                self.inverted_index[word] = (doc_idx, tfs, positions)
+            else:
+                self.inverted_index.pop(word, None)
+            self.idf.pop(word, None)
+            self.bm25_impacts.pop(word, None)
+            self.bm25_upper_bounds.pop(word, None)
+        self._removed_postings.clear()
+        self._pending_postings.clear()
+
+    def _merge_appended_postings(self, word):
+        '''Сливает куски постингов слова из пакетов ingest с его массивами одним concatenate'''
+        parts = self._appended_postings.pop(word)
+        if word in self.inverted_index:
+            parts.insert(0, self.inverted_index[word])
+        self.inverted_index[word] = tuple(np.concatenate(arrays) for arrays in zip(*parts))
+        self.idf.pop(word, None)
+        self.bm25_impacts.pop(word, None)
+        self.bm25_upper_bounds.pop(word, None)
+
+    def _term_stats(self, word):
+        '''Возвращает постинги слова и его IDF, при необходимости досчитывая IDF,
+            вклады в BM25 (k1=1.5, b=0.75) и их верхнюю границу для отсечения MaxScore'''
+        doc_idx, tfs, _ = self.inverted_index[word]
+        if word not in self.idf:
+            total_docs, avg_doc_len = self._collection_size_and_avg_len()
+            df = self.collection_stats['doc_freq'][word] if self.collection_stats else len(doc_idx)
+            self.idf[word] = log((total_docs - df + 0.5) / (df + 0.5) + 1)
+            length_norm = 1.5 * (1 - 0.75 + 0.75 * self.doc_lengths[doc_idx] / avg_doc_len)
+            impacts = self.idf[word] * tfs * (1.5 + 1) / (tfs + length_norm)
+            self.bm25_impacts[word] = impacts
+            self.bm25_upper_bounds[word] = impacts.max()
+        return doc_idx, tfs, self.idf[word]
+
+    def _collection_size_and_avg_len(self):
+        '''Число документов и средняя длина документа коллекции (глобальные для шарда)'''
+        if self.collection_stats:
+            return self.collection_stats['total_docs'], self.collection_stats['avg_doc_len']
+        return self.total_docs, self.avg_doc_len
+
+    def set_collection_stats(self, stats):
+        '''Задает шарду статистики всей коллекции (total_docs, avg_doc_len, doc_freq, tfidf_doc_freq)'''
+        self.collection_stats = stats
+        self._bm25_stats_key = None
+        if self.tfidf_vectorizer is not None:
+            self._tfidf_dirty = True
+        self.generation += 1
+
+    def intersect_postings(self, *words):
+        '''Возвращает слоты документов, содержащих все слова. Постинги отсортированы,
+            поэтому пересечение идет от самого короткого списка двоичным поиском по остальным'''
+        self._refresh_index()
+        words = [word.lower() for word in words]
+        if not words or any(word not in self.inverted_index for word in words):
+            return np.zeros(0, dtype=np.int32)
+        lists = sorted((self.inverted_index[word][0] for word in words), key=len)
+        result = np.asarray(lists[0])
+        for doc_idx in lists[1:]:
+            if not len(result):
+                break
+            positions = np.searchsorted(doc_idx, result)
+            found = positions < len(doc_idx)
+            found[found] = doc_idx[positions[found]] == result[found]
+            result = result[found]
+        return result
+
+    @staticmethod
+    def _gather_ranges(starts, counts):
+        '''Индексы элементов подряд идущих отрезков [start, start + count) плоского массива'''
+        counts = np.asarray(counts, dtype=np.int64)
+        ends = np.cumsum(counts)
+        total = ends[-1] if len(ends) else 0
+        return np.repeat(np.asarray(starts, dtype=np.int64) - (ends - counts), counts) + np.arange(total)
+
+    def _candidate_positions(self, word, candidates):
+        '''Позиции слова в документах candidates (отсортированные слоты, содержащие слово):
+            возвращает номера кандидатов и позиции, упорядоченные по ним'''
+        doc_idx, tfs, positions = self.inverted_index[word]
+        found = np.searchsorted(doc_idx, candidates)
+        counts = tfs[found].astype(np.int64)
+        starts = (np.cumsum(tfs, dtype=np.int64) - tfs)[found]
+        return np.repeat(np.arange(len(candidates)), counts), positions[self._gather_ranges(starts, counts)]
+
+    def _phrase_slots(self, words):
+        '''Слоты документов, где слова идут подряд: пересечение списков позиций,
+            сдвинутых на номер слова во фразе'''
+        candidates = self.intersect_postings(*words)
+        if len(words) < 2 or not len(candidates):
+            return candidates
+        # ключ вхождения - номер кандидата * stride + позиция, так позиции разных документов не пересекаются
+        stride = int(self.doc_lengths.max()) + 1
+        matches = None
+        for shift, word in enumerate(words):
+            ranks, positions = self._candidate_positions(word, candidates)
+            keys = (ranks * stride + positions - shift)[positions >= shift]
+            matches = keys if matches is None else np.intersect1d(matches, keys, assume_unique=True)
+        return candidates[np.unique(matches // stride)]
+
+    def _near_slots(self, first, second, k):
+        '''Слоты документов, где два слова встречаются на расстоянии не больше k слов (в любом порядке)'''
+        candidates = self.intersect_postings(first, second)
+        if not len(candidates):
+            return candidates
+        stride = int(self.doc_lengths.max()) + k + 1
+        first_ranks, first_positions = self._candidate_positions(first, candidates)
+        second_ranks, second_positions = self._candidate_positions(second, candidates)
+        first_keys = first_ranks * stride + first_positions
+        second_keys = second_ranks * stride + second_positions
+        # для каждого вхождения первого слова ищем вхождения второго в окне [pos - k, pos + k]
+        left = np.searchsorted(second_keys, first_keys - k)
+        right = np.searchsorted(second_keys, first_keys + k, side='right')
+        # у повторенного слова само вхождение в окно не считается
+        hit = right - left > (1 if first == second else 0)
+        return candidates[np.unique(first_ranks[hit])]
+
+    def phrase_query(self, phrase):
+        '''Возвращает id страниц (в порядке добавления), содержащих фразу целиком'''
+        return [self.doc_ids[slot] for slot in self._phrase_slots(phrase.lower().split())]
+
+    def near_query(self, query, k=3):
+        '''Запрос NEAR/k: возвращает id страниц, в которых каждая пара соседних слов запроса
+            встречается на расстоянии не больше k слов'''
+        words = query.lower().split()
+        slots = self.intersect_postings(*words)
+        for first, second in zip(words, words[1:]):
+            slots = np.intersect1d(slots, self._near_slots(first, second, k))
+        return [self.doc_ids[slot] for slot in slots]
+
+    def _proximity_lists(self, query, window=3):
+        '''Списки (слоты, вклад) близости для пар соседних слов запроса: документ получает
+            1 / (число пар) за каждую пару, слова которой стоят не дальше window слов'''
+        words = query.lower().split()
+        pairs = list(zip(words, words[1:]))
+        return [(slots, np.full(len(slots), 1 / len(pairs)))
+                for slots in (self._near_slots(first, second, window) for first, second in pairs)]
+
+    def compute_proximity_scores(self, query, window=3):
+        '''Оценка близости слов запроса для всех документов (массив по слотам self.doc_ids):
+            доля пар соседних слов запроса, встречающихся в документе рядом (в окне window)'''
+        self._refresh_index()
+        scores = np.zeros(len(self.doc_ids))
+        for slots, values in self._proximity_lists(query, window):
+            scores[slots] += values
+        return scores
+
+    def compute_tfidf_vectors(self):
+        '''Вычисляет векторы TF-IDF для страниц на английском языке (CSR-матрица по слотам)'''
+        self._check_contents()
+        self.generation += 1
+        self.tfidf_vectorizer = TfidfVectorizer(stop_words='english')
+        self._tfidf_analyzer = self.tfidf_vectorizer.build_analyzer()
+        self.tfidf_vocabulary = {}
+        self.tfidf_doc_freq = []
+        self._tfidf_rows = {}
+
+        for slot, doc_id in enumerate(self.doc_ids):
+            if doc_id is not None:
+                self._index_tfidf_terms(slot)
+
+        self._refresh_tfidf()
+
+    def _index_tfidf_terms(self, slot):
+        '''Добавляет счетчики слов страницы в TF-IDF, расширяя словарь новыми словами'''
+        counts = Counter(self._tfidf_analyzer(self.pages[self.doc_ids[slot]]['content']))
+        cols = []
+        for term in counts:
+            col = self.tfidf_vocabulary.get(term)
+            if col is None:
+                col = len(self.tfidf_vocabulary)
+                self.tfidf_vocabulary[term] = col
+                self.tfidf_doc_freq.append(0)
+            self.tfidf_doc_freq[col] += 1
+            cols.append(col)
+
+        cols = np.array(cols, dtype=np.int32)
+        values = np.array(list(counts.values()), dtype=np.float64)
+        order = np.argsort(cols)
+        self._tfidf_rows[slot] = (cols[order], values[order])
+        self._tfidf_dirty = True
+
+    def _unindex_tfidf_terms(self, slot):
+        '''Удаляет счетчики слов страницы из TF-IDF'''
+        cols, _ = self._tfidf_rows.pop(slot)
+        for col in cols:
+            self.tfidf_doc_freq[col] -= 1
+        self._tfidf_dirty = True
+
+    def _refresh_tfidf(self):
+        '''Пересобирает L2-нормированную TF-IDF матрицу из сохраненных счетчиков
+            (IDF как в sklearn: ln((1 + n) / (1 + df)) + 1) без повторной токенизации'''
+        counts = self._tfidf_counts_matrix()
+
+        if self.collection_stats:
+            global_doc_freq = self.collection_stats['tfidf_doc_freq']
+            df = np.array([global_doc_freq.get(term, 0) for term in self.tfidf_vocabulary], dtype=np.float64)
+        else:
+            df = np.array(self.tfidf_doc_freq, dtype=np.float64)
+        self.tfidf_idf = np.log((1 + self._collection_size_and_avg_len()[0]) / (1 + df)) + 1
+        weighted = (counts @ sp.diags(self.tfidf_idf)).tocsr()
+        # normalize не принимает пустые матрицы (например, у шарда без страниц)
+        self.tfidf_matrix = normalize(weighted, norm='l2').tocsr() if weighted.nnz else weighted
+
+        # столбцы матрицы служат постингами TF-IDF, максимум по столбцу - верхней границей вклада слова
+        self.tfidf_matrix_csc = self.tfidf_matrix.tocsc()
+        self.tfidf_matrix_csc.sort_indices()
+        self.tfidf_upper_bounds = self.tfidf_matrix_csc.max(axis=0).toarray().ravel() \
+            if weighted.nnz else np.zeros(weighted.shape[1])
+        self._tfidf_dirty = False
+        if self._topic_pagerank_params is not None:
+            self._refresh_topic_centroids()
+
+    def _tfidf_query_matrix(self, queries):
+        '''L2-нормированные TF-IDF векторы запросов одной разреженной матрицей (запросы x словарь);
+            слова, которых нет в коллекции, игнорируются'''
+        rows, cols, values = [], [], []
+        for i, query in enumerate(queries):
+            counts = Counter(term for term in self._tfidf_analyzer(query)
+                             if term in self.tfidf_vocabulary and self.tfidf_doc_freq[self.tfidf_vocabulary[term]] > 0)
+            for term, count in counts.items():
+                rows.append(i)
+                cols.append(self.tfidf_vocabulary[term])
+                values.append(count)
+        query_matrix = sp.csr_matrix((np.array(values, dtype=np.float64), (rows, cols)),
+                                     shape=(len(queries), len(self.tfidf_vocabulary)))
+        if not self.collection_stats:
+            weighted = (query_matrix @ sp.diags(self.tfidf_idf)).tocsr()
+            return normalize(weighted, norm='l2').tocsr() if weighted.nnz else weighted
+
+        # у шарда норма запроса считается по словам всей коллекции, а не только своего словаря
+        total_docs = self.collection_stats['total_docs']
+        global_doc_freq = self.collection_stats['tfidf_doc_freq']
+        norms = np.ones(len(queries))
+        for i, query in enumerate(queries):
+            weights = [count * (log((1 + total_docs) / (1 + global_doc_freq[term])) + 1)
+                       for term, count in Counter(self._tfidf_analyzer(query)).items() if term in global_doc_freq]
+            norms[i] = np.sqrt(np.dot(weights, weights)) or 1.0
+        return (sp.diags(1 / norms) @ query_matrix @ sp.diags(self.tfidf_idf)).tocsr()
+
+    def _tfidf_query_vector(self, query):
+        '''L2-нормированный TF-IDF вектор запроса'''
+        return self._tfidf_query_matrix([query])
+
+    def _bm25_query_matrix(self, queries):
+        '''BM25 scores (запросы x слоты) как произведение матрицы вхождений слов в запросы
+            на разреженную матрицу вкладов BM25 этих слов'''
+        term_ids = {}
+        rows, cols = [], []
+        for i, query in enumerate(queries):
+            for word in query.lower().split():
+                if word in self.inverted_index:
+                    rows.append(i)
+                    cols.append(term_ids.setdefault(word, len(term_ids)))
+        occurrences = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(queries), len(term_ids)))
+
+        words = list(term_ids)
+        postings = [self._term_stats(word)[0] for word in words]
+        indptr = np.zeros(len(words) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(doc_idx) for doc_idx in postings])
+        impacts = sp.csr_matrix((np.concatenate([self.bm25_impacts[word] for word in words] + [np.zeros(0)]),
+                                 np.concatenate(postings + [np.zeros(0, dtype=np.int32)]), indptr),
+                                shape=(len(words), len(self.doc_ids)))
+        scores = (occurrences @ impacts).tocsr()
+        scores.sort_indices()
+        return scores
+
+    def _build_link_matrix(self, pages, page_to_idx):
+        '''Строит разреженную (CSR) матрицу переходов M[j, i] = 1 / outdeg(i)
+            и маску висячих страниц (без исходящих ссылок внутри коллекции)'''
+        n = len(pages)
+        src, dst = [], []
+        for i, page in enumerate(pages):
+            if page is None:
+                continue
+            for target in self.pages[page]['outgoing_links']:
+                if target in page_to_idx:
+                    src.append(i)
+                    dst.append(page_to_idx[target])
+        src = np.array(src, dtype=np.int64)
+        dst = np.array(dst, dtype=np.int64)
+
+        out_degree = np.bincount(src, minlength=n).astype(np.float64)
+        dangling = out_degree == 0
+        weights = 1.0 / out_degree[src]
+        M = sp.csr_matrix((weights, (dst, src)), shape=(n, n))
+        return M, dangling
+
+    @staticmethod
+    def _quadratic_extrapolation(x0, x1, x2, x3):
+        '''Квадратичная экстраполяция (Kamvar et al., 2003) по четырем последним итерациям'''
+        y = np.column_stack([x1 - x0, x2 - x0, x3 - x0])
+        gamma, *_ = np.linalg.lstsq(y[:, :2], -y[:, 2], rcond=None)
+        g1, g2, g3 = gamma[0], gamma[1], 1.0
+        x = (g1 + g2 + g3) * x1 + (g2 + g3) * x2 + g3 * x3
+        x = np.maximum(x, 0)
+        return x / x.sum() if x.sum() > 0 else x3
+
+    def compute_pagerank(self, damping=0.85, max_iter=100, tol=1e-6, personalization=None,
+                         method='power', extrapolation_every=10, warm_start=False):
+        '''Вычисляет PageRank на основе outgoing_links (method: 'power' или 'extrapolation'),
+            возвращает отчет о сходимости'''
+        self.generation += 1
+        pages = self.doc_ids
+        page_to_idx = self.doc_index
+        if method not in ('power', 'extrapolation'):
+            raise ValueError(f"Неизвестный метод: {method}")
+
+        M, dangling = self._build_link_matrix(pages, page_to_idx)
+        live = np.array([page is not None for page in pages], dtype=np.float64)
+
+        if personalization is None:
+            p = live / live.sum()
+        else:
+            p = np.array([personalization.get(page, 0) if page is not None else 0 for page in pages],
+                         dtype=np.float64)
+            if p.sum() <= 0:
+                raise ValueError("Вектор персонализации должен иметь положительную сумму")
+            p = p / p.sum()
+
+        warm_start = bool(warm_start and self.pagerank)
+        if warm_start:
+            # новые страницы стартуют со своей долей вектора персонализации
+            pr = np.array([self.pagerank.get(page, p[i]) if page is not None else 0
+                           for i, page in enumerate(pages)])
+            pr = pr / pr.sum()
+        else:
+            pr = p.copy()
+        history = [pr]
+        residual = np.inf
+        iterations = 0
+
+        for iterations in range(1, max_iter + 1):
+            dangling_mass = pr[dangling].sum()
+            new_pr = damping * (M @ pr + dangling_mass * p) + (1 - damping) * p
+            residual = np.abs(new_pr - pr).sum()
+            pr = new_pr
+            if residual < tol:
+                break
+
+            if method == 'extrapolation':
+                history = history[-3:] + [pr]
+                if iterations % extrapolation_every == 0 and len(history) == 4:
+                    pr = self._quadratic_extrapolation(*history)
+                    history = [pr]
+
+        pr = pr / pr.sum()
+        self.pagerank_vector = pr
+        self.pagerank = {page: pr[i] for i, page in enumerate(pages) if page is not None}
+        self.pagerank_report = {
+            'method': method,
+            'iterations': iterations,
+            'residual': float(residual),
+            'converged': bool(residual < tol),
+            'dangling_pages': int((dangling & (live > 0)).sum()),
+            'warm_start': warm_start
+        }
+        self._pagerank_params = {
+            'damping': damping, 'max_iter': max_iter, 'tol': tol,
+            'personalization': personalization, 'method': method,
+            'extrapolation_every': extrapolation_every
+        }
+        self._pagerank_dirty = False
+        return self.pagerank_report
+
+    def _topic_seed_matrix(self, topics):
+        '''Векторы персонализации тем столбцами матрицы (слоты x темы), каждый с суммой 1.
+            Тема без опорных страниц в индексе получает равномерный вектор (обычный PageRank)'''
+        live = np.array([doc_id is not None for doc_id in self.doc_ids], dtype=np.float64)
+        seeds = np.zeros((len(self.doc_ids), len(topics)))
+        for j, pages in enumerate(topics.values()):
+            weights = pages if isinstance(pages, dict) else dict.fromkeys(pages, 1.0)
+            for doc_id, weight in weights.items():
+                if doc_id in self.doc_index:
+                    seeds[self.doc_index[doc_id], j] += weight
+            if seeds[:, j].sum() <= 0:
+                seeds[:, j] = live
+        total = seeds.sum(axis=0)
+        return seeds / np.where(total > 0, total, 1)
+
+    def compute_topic_pagerank(self, topics, damping=0.85, max_iter=100, tol=1e-6, warm_start=False):
+        '''Вычисляет тематический PageRank для тем {тема: id опорных страниц или {id: вес}},
+            возвращает отчет о сходимости'''
+        if not topics:
+            raise ValueError("Нужна хотя бы одна тема")
+        self.generation += 1
+        names = list(topics)
+        M, dangling = self._build_link_matrix(self.doc_ids, self.doc_index)
+        seeds = self._topic_seed_matrix(topics)
+
+        warm_start = bool(warm_start and self.topic_names == names and self.topic_pagerank_matrix.size)
+        if warm_start:
+            # удаленные страницы выбывают, новые стартуют со своей долей вектора персонализации
+            pr = seeds.copy()
+            n_old = min(len(self.topic_pagerank_matrix), len(self.doc_ids))
+            pr[:n_old] = self.topic_pagerank_matrix[:n_old]
+            pr[[doc_id is None for doc_id in self.doc_ids]] = 0
+            total = pr.sum(axis=0)
+            pr = np.where(total > 0, pr / np.where(total > 0, total, 1), seeds)
+        else:
+            pr = seeds.copy()
+        residual = np.inf
+        iterations = 0
+
+        for iterations in range(1, max_iter + 1):
+            dangling_mass = pr[dangling].sum(axis=0)
+            new_pr = damping * (M @ pr + seeds * dangling_mass) + (1 - damping) * seeds
+            # сходимость - по худшей из тем
+            residual = np.abs(new_pr - pr).sum(axis=0).max() if pr.size else 0.0
+            pr = new_pr
+            if residual < tol:
+                break
+
+        total = pr.sum(axis=0)
+        self.topic_names = names
+        self.topic_pagerank_matrix = np.ascontiguousarray(pr / np.where(total > 0, total, 1))
+        self.topic_pagerank_report = {
+            'topics': len(names),
+            'iterations': iterations,
+            'residual': float(residual),
+            'converged': bool(residual < tol),
+            'warm_start': warm_start
+        }
+        self._topic_pagerank_params = {'topics': topics, 'damping': damping, 'max_iter': max_iter, 'tol': tol}
+        self._topic_pagerank_dirty = False
+        if self.tfidf_vectorizer is not None and not self._tfidf_dirty:
+            self._refresh_topic_centroids()
+        return self.topic_pagerank_report
+
+    def _refresh_topic_centroids(self):
+        '''Центроиды тем в пространстве TF-IDF: L2-нормированные взвешенные суммы векторов
+            опорных страниц (разреженная матрица темы x словарь TF-IDF)'''
+        seeds = self._topic_seed_matrix(self._topic_pagerank_params['topics'])
+        centroids = (sp.csr_matrix(seeds.T) @ self.tfidf_matrix).tocsr()
+        self.topic_centroids = normalize(centroids, norm='l2').tocsr() if centroids.nnz else centroids
+
+    def _topic_mix(self, query_matrix):
+        '''Доли тем для запросов (запросы x темы): косинусы TF-IDF запроса с центроидами тем,
+            нормированные на сумму 1. Запрос, не похожий ни на одну тему, смешивает их поровну'''
+        if self._topic_pagerank_params is None:
+            raise ValueError("Тематический PageRank не посчитан: сначала вызовите compute_topic_pagerank")
+        n_topics = len(self.topic_names)
+        if self.topic_centroids is None:
+            return np.full((query_matrix.shape[0], n_topics), 1 / n_topics)
+        similarity = (query_matrix @ self.topic_centroids.T).toarray()
+        total = similarity.sum(axis=1, keepdims=True)
+        return np.where(total > 0, similarity / np.where(total > 0, total, 1), 1 / n_topics)
+
+    def topic_mix(self, query):
+        '''Доли тем в запросе: словарь {тема: вес}, веса в сумме дают 1'''
+        self._refresh_index()
+        self._ensure_pagerank()
+        return dict(zip(self.topic_names, self._topic_mix(self._tfidf_query_vector(query))[0]))
+
+    def _static_scores(self, query, weights, query_vec=None):
+        '''Вклады PageRank и тематического PageRank, не зависящие от слов запроса (массив по слотам)'''
+        scores = weights.get('pagerank', 0) * self.pagerank_vector
+        w_topic = weights.get('topic_pagerank', 0)
+        if w_topic:
+            if query_vec is None:
+                query_vec = self._tfidf_query_vector(query)
+            scores = scores + w_topic * (self.topic_pagerank_matrix @ self._topic_mix(query_vec)[0])
+        return scores
+
+    def compute_bm25_scores(self, query, k1=1.5, b=0.75):
+        '''Вычисляет BM25 scores сразу для всех документов (массив по слотам self.doc_ids),
+            проходя только по постингам слов запроса'''
+        self._refresh_index()
+        scores = np.zeros(len(self.doc_ids))
+        if not self.total_docs:
+            return scores
+        avg_doc_len = self._collection_size_and_avg_len()[1]
+
+        for word in query.lower().split():
+            if word not in self.inverted_index:
+                continue
+            doc_idx, tfs, idf = self._term_stats(word)
+            length_norm = k1 * (1 - b + b * self.doc_lengths[doc_idx] / avg_doc_len)
+            scores[doc_idx] += idf * tfs * (k1 + 1) / (tfs + length_norm)
+
+        return scores
+
+    def compute_bm25_score(self, query, doc_id, k1=1.5, b=0.75):
+        '''Вычисляет BM25 score на основе TF для одного документа'''
+        self._refresh_index()
+        doc_i = self.doc_index[doc_id]
+        doc_len = self.doc_lengths[doc_i]
+        avg_doc_len = self._collection_size_and_avg_len()[1]
+        score = 0
+
+        for word in query.lower().split():
+            if word not in self.inverted_index:
+                continue
+            doc_idx, tfs, idf = self._term_stats(word)
+            pos = np.searchsorted(doc_idx, doc_i)
+            if pos == len(doc_idx) or doc_idx[pos] != doc_i:
+                continue
+            tf = tfs[pos]
+
+            numerator = tf * (k1 + 1)
+            denominator = tf + k1 * (1 - b + b * doc_len / avg_doc_len)
+            score += idf * numerator / denominator
+
+        return score
+
+    def compute_tfidf_cosine(self, query):
+        '''Вычисляет косинусное сходство между TF-IDF векторами запроса и всех страниц
+            по столбцам слов запроса (массив по слотам self.doc_ids)'''
+        self._refresh_index()
+        return self._tfidf_scores(self._tfidf_query_vector(query))
+
+    def _tfidf_scores(self, query_vec, docs=None):
+        '''Косинусы TF-IDF запроса со страницами docs (по умолчанию - со всеми): проходятся только
+            столбцы CSC-матрицы слов запроса, в одном порядке для всех страниц и любых docs'''
+        csc = self.tfidf_matrix_csc
+        scores = np.zeros(self.tfidf_matrix.shape[0] if docs is None else len(docs))
+        order = np.argsort(query_vec.indices)
+        for j, q_weight in zip(query_vec.indices[order], query_vec.data[order]):
+            start, end = csc.indptr[j], csc.indptr[j + 1]
+            if docs is None:
+                scores[csc.indices[start:end]] += csc.data[start:end] * q_weight
+                continue
+            rows = csc.indices[start:end]
+            if not len(rows):
+                continue
+            pos = np.minimum(np.searchsorted(rows, docs), len(rows) - 1)
+            found = rows[pos] == docs
+            scores[found] += csc.data[start:end][pos[found]] * q_weight
+        return scores
+
+    def _query_score_lists(self, query, weights):
+        '''Возвращает списки (индексы документов, значения, вес, верхняя граница вклада)
+            для слов запроса: постинги BM25, столбцы TF-IDF матрицы и пары близких слов'''
+        lists = []
+        w_bm25 = weights.get('bm25', 0)
+        w_tfidf = weights.get('tfidf', 0)
+
+        if w_bm25 > 0:
+            for word in query.lower().split():
+                if word in self.inverted_index:
+                    doc_idx = self._term_stats(word)[0]
+                    lists.append((doc_idx, self.bm25_impacts[word], w_bm25,
+                                  w_bm25 * self.bm25_upper_bounds[word]))
+
+        if w_tfidf > 0:
+            query_vec = self._tfidf_query_vector(query)
+            csc = self.tfidf_matrix_csc
+            for j, q_weight in zip(query_vec.indices, query_vec.data):
+                start, end = csc.indptr[j], csc.indptr[j + 1]
+                weight = w_tfidf * q_weight
+                lists.append((csc.indices[start:end], csc.data[start:end], weight,
+                              weight * self.tfidf_upper_bounds[j]))
+
+        w_proximity = weights.get('proximity', 0)
+        if w_proximity > 0:
+            for slots, values in self._proximity_lists(query):
+                if len(slots):
+                    lists.append((slots, values, w_proximity, w_proximity * values[0]))
+
+        return lists
+
+    def _maxscore_candidates(self, query, weights, top_k, static_scores):
+        '''Отбирает кандидатов в top_k алгоритмом MaxScore: документы, которые не могут
+            догнать текущий порог кучи, не досчитываются (возвращает отсортированные слоты)'''
+        lists = sorted(self._query_score_lists(query, weights), key=lambda l: l[3])
+        prefix_bounds = np.cumsum([l[3] for l in lists])
+        pr_bound = static_scores.max() if static_scores.size else 0
+        cursors = [0] * len(lists)
+        # суммы вкладов здесь складываются в другом порядке, чем при полном переборе, поэтому
+        # отсекаются только документы, отстающие от порога больше, чем на погрешность округления;
+        # документы на пороге остаются кандидатами и ранжируются точными scores
+        tolerance = 1e-9
+
+        def lookup(i, doc):
+            docs = lists[i][0]
+            pos = cursors[i] + np.searchsorted(docs[cursors[i]:], doc)
+            cursors[i] = pos
+            if pos < len(docs) and docs[pos] == doc:
+                return lists[i][2] * lists[i][1][pos]
+            return 0
+
+        # документы без совпадений со словами запроса ранжируются только по PageRank,
+        # поэтому достаточно заранее положить в кучу top_k лучших из них по PageRank
+        heap = []
+        scored = {}
+        if pr_bound > 0:
+            for doc in np.argsort(-static_scores, kind='stable')[:top_k]:
+                doc = int(doc)
+                if self.doc_ids[doc] is None:
+                    continue
+                score = static_scores[doc]
+                for l in lists:
+                    pos = np.searchsorted(l[0], doc)
+                    if pos < len(l[0]) and l[0][pos] == doc:
+                        score += l[2] * l[1][pos]
+                heapq.heappush(heap, score)
+                scored[doc] = score
+
+        def threshold():
+            return heap[0] - tolerance if len(heap) == top_k else -np.inf
+
+        # списки [0, first_essential) неосновные: их суммы границ не хватает, чтобы дойти до порога
+        first_essential = 0
+        while first_essential < len(lists) and prefix_bounds[first_essential] + pr_bound < threshold():
+            first_essential += 1
+
+        while first_essential < len(lists):
+            candidates = [lists[i][0][cursors[i]] for i in range(first_essential, len(lists))
+                          if cursors[i] < len(lists[i][0])]
+            if not candidates:
+                break
+            doc = int(min(candidates))
+
+            score = static_scores[doc] if pr_bound > 0 else 0
+            for i in range(first_essential, len(lists)):
+                docs = lists[i][0]
+                if cursors[i] < len(docs) and docs[cursors[i]] == doc:
+                    score += lists[i][2] * lists[i][1][cursors[i]]
+                    cursors[i] += 1
+
+            pruned = False
+            for i in range(first_essential - 1, -1, -1):
+                if score + prefix_bounds[i] < threshold():
+                    pruned = True
+                    break
+                score += lookup(i, doc)
+
+            if pruned or doc in scored:
+                continue
+            scored[doc] = score
+            if len(heap) < top_k:
+                heapq.heappush(heap, score)
+            elif score > heap[0]:
+                heapq.heapreplace(heap, score)
+            while first_essential < len(lists) and prefix_bounds[first_essential] + pr_bound < threshold():
+                first_essential += 1
+
+        limit = threshold()
+        candidates = [doc for doc, score in scored.items() if score >= limit]
+        # как и при полном переборе, недостающие места занимают страницы с нулевым score
+        if len(heap) < top_k:
+            for doc, doc_id in enumerate(self.doc_ids):
+                if len(candidates) >= top_k:
+                    break
+                if doc_id is not None and doc not in scored:
+                    candidates.append(doc)
+        return np.array(sorted(candidates), dtype=np.int64)
+
+    def _candidate_scores(self, query, weights, docs, static_scores, k1=1.5, b=0.75):
+        '''Итоговые scores, BM25 и TF-IDF слотов docs - теми же операциями, что при полном переборе'''
+        avg_doc_len = self._collection_size_and_avg_len()[1]
+        bm25_scores = np.zeros(len(docs))
+        for word in query.lower().split():
+            if word not in self.inverted_index:
+                continue
+            doc_idx, tfs, idf = self._term_stats(word)
+            pos = np.minimum(np.searchsorted(doc_idx, docs), len(doc_idx) - 1)
+            found = doc_idx[pos] == docs
+            slots, tf = doc_idx[pos[found]], tfs[pos[found]]
+            length_norm = k1 * (1 - b + b * self.doc_lengths[slots] / avg_doc_len)
+            bm25_scores[found] += idf * tf * (k1 + 1) / (tf + length_norm)
+        tfidf_scores = self._tfidf_scores(self._tfidf_query_vector(query), docs)
+
+        scores = weights.get('bm25', 0) * bm25_scores + weights.get('tfidf', 0) * tfidf_scores + static_scores[docs]
+        w_proximity = weights.get('proximity', 0)
+        if w_proximity:
+            proximity_scores = np.zeros(len(docs))
+            for slots, values in self._proximity_lists(query):
+                pos = np.minimum(np.searchsorted(slots, docs), max(len(slots) - 1, 0))
+                found = slots[pos] == docs if len(slots) else np.zeros(len(docs), dtype=bool)
+                proximity_scores[found] += values[pos[found]]
+            scores += w_proximity * proximity_scores
+        return scores, bm25_scores, tfidf_scores
+
+    def _ensure_pagerank(self):
+        '''Считает PageRank, если он еще не посчитан, или пересчитывает его с теплым стартом после изменений'''
+        if not self.pagerank:
+            self.compute_pagerank()
+        elif self._pagerank_dirty:
+            self.compute_pagerank(**self._pagerank_params, warm_start=True)
+        if self._topic_pagerank_dirty:
+            self.compute_topic_pagerank(**self._topic_pagerank_params, warm_start=True)
+
+    def _result(self, doc, score, bm25_score, tfidf_score):
+        doc_id = self.doc_ids[doc]
+        return {
+            'id': doc_id,
+            'title': self.pages[doc_id]['title'],
+            'url': self.pages[doc_id]['url'],
+            'score': score,
+            'pagerank': self.pagerank[doc_id],
+            'bm25': bm25_score,
+            'tfidf': tfidf_score
+        }
+
+    def search(self, query, weights=None, top_k=5, mode='exhaustive'):
+        '''Осуществляет поиск по запросу с заданными весами (комбинированное ранжирование),
+            возвращает top_k релевантных страниц со scores (mode: 'exhaustive' или 'maxscore')'''
+        if weights is None:
+            weights = {'bm25': 0.34, 'tfidf': 0.33, 'pagerank': 0.33}
+        if mode not in ('exhaustive', 'maxscore'):
+            raise ValueError(f"Неизвестный режим поиска: {mode}")
+        if not self.cache_size:
+            return self._search(query, weights, top_k, mode)
+
+        # BM25 и TF-IDF не различают регистр и пробелы, поэтому ключ - нормализованный текст запроса
+        key = (' '.join(query.lower().split()), tuple(sorted(weights.items())), top_k, mode)
+        entry = self._result_cache.get(key)
+        if entry is not None:
+            generation, created, results = entry
+            if generation == self.generation and \
+                    (self.cache_ttl is None or time.monotonic() - created < self.cache_ttl):
+                self._result_cache.move_to_end(key)
+                self.cache_hits += 1
+                return [dict(result) for result in results]
+            del self._result_cache[key]
+
+        self.cache_misses += 1
+        results = self._search(query, weights, top_k, mode)
+        # поколение берется после поиска: ленивый пересчет PageRank внутри него тоже меняет индекс
+        self._result_cache[key] = (self.generation, time.monotonic(), results)
+        if len(self._result_cache) > self.cache_size:
+            self._result_cache.popitem(last=False)
+        return [dict(result) for result in results]
+
+    def cache_info(self):
+        '''Статистика кэша результатов поиска (для подбора его размера)'''
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'size': len(self._result_cache),
+            'max_size': self.cache_size,
+            'ttl': self.cache_ttl,
+            'generation': self.generation
+        }
+
+    def clear_cache(self):
+        '''Очищает кэш результатов поиска и обнуляет счетчики попаданий'''
+        self._result_cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _live_slots(self):
+        '''Слоты существующих страниц (пересчитываются только после изменения индекса)'''
+        if self._live_generation != self.generation:
+            self._live = np.flatnonzero([doc_id is not None for doc_id in self.doc_ids])
+            self._live_generation = self.generation
+        return self._live
+
+    def _search(self, query, weights, top_k, mode):
+        '''Поиск без кэша (см. search)'''
+        if top_k <= 0:
+            return []
+        self._refresh_index()
+        self._ensure_pagerank()
+
+        if mode == 'maxscore' and min(weights.values(), default=0) >= 0:
+            static_scores = self._static_scores(query, weights)
+            docs = self._maxscore_candidates(query, weights, top_k, static_scores)
+            scores, bm25_scores, tfidf_scores = self._candidate_scores(query, weights, docs, static_scores)
+            # при равенстве scores выше страница, добавленная раньше (как при полном переборе)
+            best = np.lexsort((docs, -scores))[:top_k]
+            return [self._result(int(docs[i]), scores[i], bm25_scores[i], tfidf_scores[i]) for i in best]
+
+        tfidf_scores = self.compute_tfidf_cosine(query)
+        bm25_scores = self.compute_bm25_scores(query)
+        w_proximity = weights.get('proximity', 0)
+        proximity_scores = self.compute_proximity_scores(query) if w_proximity else None
+        static_scores = self._static_scores(query, weights)
+
+        scores = weights.get('bm25', 0) * bm25_scores + weights.get('tfidf', 0) * tfidf_scores + static_scores
+        if w_proximity:
+            scores += w_proximity * proximity_scores
+        live = self._live_slots()
+        candidates = live
+        if top_k < len(live):
+            # кандидаты - все страницы со score не ниже k-го, чтобы равенства на границе решал слот
+            kth = np.partition(scores[live], -top_k)[-top_k]
+            candidates = live[scores[live] >= kth]
+        # при равенстве scores выше страница, добавленная раньше (меньший слот)
+        best = candidates[np.lexsort((candidates, -scores[candidates]))[:top_k]]
+        return [self._result(int(doc), scores[doc], bm25_scores[doc], tfidf_scores[doc]) for doc in best]
+
+    def search_many(self, queries, weights=None, top_k=5, n_jobs=None, chunk_size=1000):
+        '''Пакетный поиск по матрицам scores (при n_jobs > 1 - в пуле процессов)'''
+        if weights is None:
+            weights = {'bm25': 0.34, 'tfidf': 0.33, 'pagerank': 0.33}
+        queries = list(queries)
+
+        self._refresh_index()
+        self._ensure_pagerank()
+
+        if min(weights.values(), default=0) < 0:
+            return [self.search(query, weights, top_k) for query in queries]
+
+        if n_jobs is not None and n_jobs > 1 and len(queries) > chunk_size:
+            chunks = [queries[i:i + chunk_size] for i in range(0, len(queries), chunk_size)]
+            # при fork дочерние процессы получают индекс без копирования и сериализации
+            context = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else None
+            with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context,
+                                     initializer=_init_search_worker, initargs=(self,)) as pool:
+                parts = pool.map(_search_many_worker, chunks, [weights] * len(chunks), [top_k] * len(chunks))
+                return [results for part in parts for results in part]
+
+        return self._search_batch(queries, weights, top_k)
+
+    def _proximity_query_matrix(self, queries):
+        '''Оценки близости слов (запросы x слоты) разреженной матрицей'''
+        rows, cols, values = [], [], []
+        for i, query in enumerate(queries):
+            for slots, pair_values in self._proximity_lists(query):
+                rows.append(np.full(len(slots), i))
+                cols.append(slots)
+                values.append(pair_values)
+        matrix = sp.csr_matrix((np.concatenate(values + [np.zeros(0)]),
+                                (np.concatenate(rows + [np.zeros(0, dtype=np.int64)]),
+                                 np.concatenate(cols + [np.zeros(0, dtype=np.int32)]))),
+                               shape=(len(queries), len(self.doc_ids)))
+        matrix.sort_indices()
+        return matrix
+
+    def _search_batch(self, queries, weights, top_k):
+        '''Ранжирует пакет запросов по матрицам scores (запросы x слоты)'''
+        w_bm25 = weights.get('bm25', 0)
+        w_tfidf = weights.get('tfidf', 0)
+        w_pr = weights.get('pagerank', 0)
+        w_topic = weights.get('topic_pagerank', 0)
+        w_proximity = weights.get('proximity', 0)
+
+        bm25 = self._bm25_query_matrix(queries)
+        query_matrix = self._tfidf_query_matrix(queries)
+        tfidf = (query_matrix @ self.tfidf_matrix.T).tocsr()
+        tfidf.sort_indices()
+        total = w_bm25 * bm25 + w_tfidf * tfidf
+        if w_proximity:
+            proximity = self._proximity_query_matrix(queries)
+            total = total + w_proximity * proximity
+        total = total.tocsr()
+        pr_scores = w_pr * self.pagerank_vector
+
+        # страницы вне разреженной строки набирают только w_pr * PageRank: лучшие из них -
+        # top_k по PageRank (или первые top_k слотов, если PageRank не учитывается)
+        live = np.array([doc_id is not None for doc_id in self.doc_ids], dtype=bool)
+        if w_pr > 0:
+            order = np.argsort(-pr_scores, kind='stable')
+            fallback = order[live[order]][:top_k]
+        else:
+            fallback = np.flatnonzero(live)[:top_k]
+
+        def top_static(scores):
+            '''top_k живых слотов по статическому вкладу (при равенстве - меньшие слоты) за O(n)'''
+            live_scores = np.where(live, scores, -np.inf)
+            if top_k >= live.sum():
+                return np.flatnonzero(live)
+            kth = np.partition(live_scores, -top_k)[-top_k]
+            above = np.flatnonzero(live_scores > kth)
+            return np.concatenate([above, np.flatnonzero(live_scores == kth)[:top_k - len(above)]])
+
+        def component(matrix, row, docs):
+            '''Значения строки разреженной матрицы для слотов docs'''
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            indices, data = matrix.indices[start:end], matrix.data[start:end]
+            pos = np.searchsorted(indices, docs)
+            found = pos < len(indices)
+            found[found] = indices[pos[found]] == docs[found]
+            values = np.zeros(len(docs))
+            values[found] = data[pos[found]]
+            return values
+
+        all_results = []
+        for row in range(len(queries)):
+            if w_topic:
+                # вклад тематического PageRank зависит от тем запроса, поэтому и запасные страницы свои
+                pr_scores = self._static_scores(queries[row], weights, query_matrix[row])
+                fallback = top_static(pr_scores)
+            start, end = total.indptr[row], total.indptr[row + 1]
+            candidates = np.union1d(total.indices[start:end], fallback)
+            bm25_scores = component(bm25, row, candidates)
+            tfidf_scores = component(tfidf, row, candidates)
+            scores = w_bm25 * bm25_scores + w_tfidf * tfidf_scores + pr_scores[candidates]
+            if w_proximity:
+                scores += w_proximity * component(proximity, row, candidates)
+            best = np.lexsort((candidates, -scores))[:top_k]
+            all_results.append([self._result(int(candidates[i]), scores[i], bm25_scores[i], tfidf_scores[i])
+                                for i in best])
+        return all_results
+
+    def save(self, path):
+        '''Сохраняет индекс в директорию path: словари, постинги с позициями, длины документов,
+            TF-IDF матрицу, векторы PageRank и тематического PageRank - в виде плоских бинарных массивов (.npy)'''
+        self._refresh_index()
+        has_topic_pagerank = self._topic_pagerank_params is not None
+        if self.pagerank or has_topic_pagerank:
+            self._ensure_pagerank()
+        os.makedirs(path, exist_ok=True)
+
+        def save_array(name, array):
+            np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(array))
+
+        def save_terms(name, terms):
+            # слова не содержат пробельных символов, поэтому разделяем их переводом строки
+            save_array(name, np.frombuffer('\n'.join(terms).encode('utf-8'), dtype=np.uint8))
+
+        terms = sorted(self.inverted_index)
+        lengths = [len(self.inverted_index[word][0]) for word in terms]
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        save_terms('terms', terms)
+        save_array('postings_offsets', offsets)
+        save_array('postings_docs', np.concatenate([self.inverted_index[w][0] for w in terms] + [np.zeros(0, np.int32)]))
+        save_array('postings_tfs', np.concatenate([self.inverted_index[w][1] for w in terms] +
+                                                  [np.zeros(0, np.uint16)]))
+        position_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        position_offsets[1:] = np.cumsum([len(self.inverted_index[word][2]) for word in terms])
+        save_array('postings_position_offsets', position_offsets)
+        save_array('postings_positions', np.concatenate([self.inverted_index[w][2] for w in terms] +
+                                                        [np.zeros(0, np.int32)]))
+        save_array('doc_lengths', self.doc_lengths)
+
+        has_tfidf = self.tfidf_vectorizer is not None
+        if has_tfidf:
+            self.tfidf_matrix.sort_indices()
+            counts = self._tfidf_counts_matrix()
+            counts.sort_indices()
+            save_terms('tfidf_terms', sorted(self.tfidf_vocabulary, key=self.tfidf_vocabulary.get))
+            save_array('tfidf_doc_freq', np.array(self.tfidf_doc_freq, dtype=np.int64))
+            save_array('tfidf_idf', self.tfidf_idf)
+            save_array('tfidf_indptr', self.tfidf_matrix.indptr)
+            save_array('tfidf_indices', self.tfidf_matrix.indices)
+            save_array('tfidf_data', self.tfidf_matrix.data)
+            save_array('tfidf_counts', counts.data)
+            save_array('tfidf_csc_indptr', self.tfidf_matrix_csc.indptr)
+            save_array('tfidf_csc_indices', self.tfidf_matrix_csc.indices)
+            save_array('tfidf_csc_data', self.tfidf_matrix_csc.data)
+            save_array('tfidf_upper_bounds', self.tfidf_upper_bounds)
+
+        has_pagerank = bool(self.pagerank)
+        if has_pagerank:
+            save_array('pagerank_vector', self.pagerank_vector)
+        if has_topic_pagerank:
+            save_array('topic_pagerank_matrix', self.topic_pagerank_matrix)
+
+        meta = {
+            'format_version': 2,
+            'doc_ids': self.doc_ids,
+            'total_doc_len': float(self._total_doc_len),
+            'indexed': self._indexed,
+            'has_tfidf': has_tfidf,
+            'tfidf_shape': list(self.tfidf_matrix.shape) if has_tfidf else None,
+            'has_pagerank': has_pagerank,
+            'pagerank_report': self.pagerank_report,
+            'pagerank_params': self._pagerank_params,
+            'topic_names': self.topic_names,
+            'topic_pagerank_report': self.topic_pagerank_report,
+            'topic_pagerank_params': self._topic_pagerank_params
+        }
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        with open(os.path.join(path, 'pages.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.pages, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        '''Загружает индекс, сохраненный методом save. При mmap=True массивы отображаются
+            в память (np.load(mmap_mode='r')) и разделяются между процессами через page cache'''
+        mmap_mode = 'r' if mmap else None
+
+        def load_array(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+
+        def load_terms(name):
+            blob = np.load(os.path.join(path, f'{name}.npy'))
+            return blob.tobytes().decode('utf-8').split('\n') if blob.size else []
+
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(os.path.join(path, 'pages.json'), encoding='utf-8') as f:
+            pages = json.load(f)
+
+        engine = cls()
+        engine.pages = pages
+        engine.doc_ids = meta['doc_ids']
+        engine.doc_index = {doc_id: i for i, doc_id in enumerate(engine.doc_ids) if doc_id is not None}
+        engine.total_docs = len(pages)
+        engine._lengths = load_array('doc_lengths')
+        engine.doc_lengths = engine._lengths
+        engine._total_doc_len = meta['total_doc_len']
+        engine.avg_doc_len = engine._total_doc_len / engine.total_docs if engine.total_docs else 0.0
+        engine.inverted_index = MappedPostings(load_terms('terms'), load_array('postings_offsets'),
+                                                load_array('postings_docs'), load_array('postings_tfs'),
+                                                load_array('postings_position_offsets'),
+                                                load_array('postings_positions'))
+        engine._indexed = meta['indexed']
+
+        if meta['has_tfidf']:
+            shape = tuple(meta['tfidf_shape'])
+            engine.tfidf_vectorizer = TfidfVectorizer(stop_words='english')
+            engine._tfidf_analyzer = engine.tfidf_vectorizer.build_analyzer()
+            engine.tfidf_vocabulary = {term: i for i, term in enumerate(load_terms('tfidf_terms'))}
+            engine.tfidf_doc_freq = load_array('tfidf_doc_freq')
+            engine.tfidf_idf = load_array('tfidf_idf')
+            engine.tfidf_matrix = sp.csr_matrix((load_array('tfidf_data'), load_array('tfidf_indices'),
+                                                 load_array('tfidf_indptr')), shape=shape)
+            engine.tfidf_matrix_csc = sp.csc_matrix((load_array('tfidf_csc_data'), load_array('tfidf_csc_indices'),
+                                                     load_array('tfidf_csc_indptr')), shape=shape)
+            engine.tfidf_upper_bounds = load_array('tfidf_upper_bounds')
+            engine._tfidf_loaded_counts = load_array('tfidf_counts')
+
+        if meta['has_pagerank']:
+            engine.pagerank_vector = load_array('pagerank_vector')
+            engine.pagerank = {doc_id: engine.pagerank_vector[i] for i, doc_id in enumerate(engine.doc_ids)
+                               if doc_id is not None}
+            engine.pagerank_report = meta['pagerank_report']
+            engine._pagerank_params = meta['pagerank_params']
+
+        if meta.get('topic_pagerank_params') is not None:
+            engine.topic_pagerank_matrix = load_array('topic_pagerank_matrix')
+            engine.topic_names = meta['topic_names']
+            engine.topic_pagerank_report = meta['topic_pagerank_report']
+            engine._topic_pagerank_params = meta['topic_pagerank_params']
+            if meta['has_tfidf']:
+                engine._refresh_topic_centroids()
+
+        engine._lazy_loaded = True
+        return engine
+
+    def _tfidf_counts_matrix(self):
+        '''Матрица счетчиков слов (слоты x словарь TF-IDF) с тем же расположением, что у tfidf_matrix'''
+        if self._lazy_loaded:
+            counts = self.tfidf_matrix.copy()
+            counts.data = np.asarray(self._tfidf_loaded_counts)
+            return counts
+        n_slots = len(self.doc_ids)
+        empty = (np.zeros(0, dtype=np.int32), np.zeros(0))
+        rows = [self._tfidf_rows.get(slot, empty) for slot in range(n_slots)]
+        indptr = np.zeros(n_slots + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(cols) for cols, _ in rows])
+        indices = np.concatenate([cols for cols, _ in rows] + [empty[0]])
+        data = np.concatenate([values for _, values in rows] + [empty[1]])
+        return sp.csr_matrix((data, indices, indptr), shape=(n_slots, len(self.tfidf_vocabulary)))
+
+    def _materialize_loaded_index(self):
+        '''Переносит загруженный с диска индекс в изменяемые структуры в памяти
+            (документные частоты, счетчики TF-IDF), чтобы поддержать инкрементальные изменения'''
+        self._lazy_loaded = False
+        self._lengths = np.array(self._lengths)
+        self.doc_lengths = self._lengths[:len(self.doc_ids)]
+
+        if self._indexed:
+            self.doc_freq = defaultdict(int, self.inverted_index.doc_freq())
+        # постинги остаются срезами загруженных массивов, но изменяться дальше будут в обычном словаре
+        self.inverted_index = dict(self.inverted_index)
+
+        if self.tfidf_vectorizer is not None:
+            counts = self.tfidf_matrix.copy()
+            counts.data = np.array(self._tfidf_loaded_counts)
+            self._tfidf_loaded_counts = None
+            self.tfidf_doc_freq = list(self.tfidf_doc_freq)
+            self._tfidf_rows = {}
+            # новая страница, ради которой материализуется индекс, уже занимает слот за пределами матрицы
+            for slot, doc_id in enumerate(self.doc_ids[:counts.shape[0]]):
+                if doc_id is not None:
+                    start, end = counts.indptr[slot], counts.indptr[slot + 1]
+                    self._tfidf_rows[slot] = (np.array(counts.indices[start:end]), counts.data[start:end])
+
+
+_worker_engine = None
+
+
+def _init_search_worker(engine):
+    '''Инициализирует процесс пула поиска: индекс хранится в глобальной переменной процесса'''
+    global _worker_engine
+    _worker_engine = engine
+
+
+def _search_many_worker(queries, weights, top_k):
+    return _worker_engine._search_batch(queries, weights, top_k)
+
+
+def iter_page_records(paths):
+    '''Читает страницы по одной из JSONL- и HTML-файлов (paths - файл, директория или их список)'''
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        else:
+            files = [path]
+        for file in files:
+            extension = os.path.splitext(file)[1].lower()
+            if extension == '.jsonl':
+                with open(file, encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            yield 'jsonl', line, file
+            elif extension in ('.html', '.htm'):
+                with open(file, encoding='utf-8', errors='replace') as f:
+                    yield 'html', f.read(), file
+
+
+class _PageHTMLParser(HTMLParser):
+    '''Извлекает из HTML заголовок, видимый текст, ссылки и канонический URL'''
+    def __init__(self):
+        super().__init__()
+        self.title = []
+        self.text = []
+        self.links = []
+        self.url = None
+        self._skip_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in ('script', 'style'):
+            self._skip_depth += 1
+        elif tag == 'title':
+            self._in_title = True
+        elif tag == 'a' and attrs.get('href'):
+            self.links.append(attrs['href'])
+        elif tag == 'link' and attrs.get('rel') == 'canonical':
+            self.url = attrs.get('href')
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style') and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == 'title':
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title.append(data)
+        elif not self._skip_depth:
+            self.text.append(data)
+
+
+def _page_id_from_path(path):
+    '''id страницы HTML-дампа - имя файла без расширения (так же разрешаются ссылки между файлами)'''
+    return os.path.splitext(os.path.basename(urlparse(path).path.rstrip('/')))[0]
+
+
+def _parse_page_record(record):
+    '''Превращает запись iter_page_records в словарь страницы'''
+    kind, data, path = record
+    if kind == 'jsonl':
+        page = json.loads(data)
+        return {
+            'id': page['id'],
+            'url': page.get('url', ''),
+            'title': page.get('title', ''),
+            'content': page.get('content', ''),
+            'outgoing_links': page.get('outgoing_links', [])
+        }
+    parser = _PageHTMLParser()
+    parser.feed(data)
+    parser.close()
+    return {
+        'id': _page_id_from_path(path),
+        'url': parser.url or path,
+        'title': ' '.join(''.join(parser.title).split()),
+        'content': ' '.join(' '.join(parser.text).split()),
+        'outgoing_links': [_page_id_from_path(link) for link in parser.links]
+    }
+
+
+_ingest_analyzer = None
+
+
+def _init_ingest_worker(analyzer):
+    '''Инициализирует процесс пула загрузки: анализатор TF-IDF движка хранится в глобальной переменной'''
+    global _ingest_analyzer
+    _ingest_analyzer = analyzer
+
+
+def _tokenize_pages(records, keep_content, analyzer=None):
+    '''Разбирает и токенизирует пакет записей для SearchEngine._add_tokenized_pages'''
+    analyzer = analyzer or _ingest_analyzer
+    pages = [_parse_page_record(record) for record in records]
+    docs_words = [page['content'].lower().split() for page in pages]
+    terms, lengths, term_offsets, docs, tfs, position_offsets, positions = SearchEngine._postings_arrays(docs_words)
+
+    tfidf_vocabulary = {}
+    indptr, indices, counts = [0], [], []
+    for page, words in zip(pages, docs_words):
+        page_counts = Counter(analyzer(page['content']))
+        indices.extend(tfidf_vocabulary.setdefault(term, len(tfidf_vocabulary)) for term in page_counts)
+        counts.extend(page_counts.values())
+        indptr.append(len(indices))
+        if not keep_content:
+            # без текста страницы из индекса ее можно удалить по списку ее слов
+            page['content'] = None
+            page['terms'] = list(dict.fromkeys(words))
+    return {
+        'pages': pages,
+        'lengths': lengths,
+        'terms': terms,
+        'term_offsets': term_offsets,
+        'docs': docs,
+        'tfs': tfs,
+        'position_offsets': position_offsets,
+        'positions': positions,
+        'tfidf_terms': list(tfidf_vocabulary),
+        'tfidf_indptr': np.array(indptr, dtype=np.int64),
+        'tfidf_indices': np.array(indices, dtype=np.int32),
+        'tfidf_counts': np.array(counts, dtype=np.float64)
+    }
+
+
+def _shard_apply(engine, operations):
+    '''Применяет к шарду накопленные изменения: ('add', страница) или ('delete', id страницы)'''
+    for operation, value in operations:
+        if operation == 'add':
+            engine.add_page(value)
+        else:
+            engine.delete_page(value)
+
+
+def _shard_build(engine):
+    engine.build_inverted_index()
+    engine.compute_tfidf_vectors()
+
+
+def _shard_local_stats(engine):
+    '''Локальные статистики шарда для сборки глобальных статистик коллекции'''
+    engine._refresh_index()
+    return {
+        'total_docs': engine.total_docs,
+        'total_doc_len': float(engine._total_doc_len),
+        'doc_freq': dict(engine.doc_freq),
+        'tfidf_doc_freq': {term: engine.tfidf_doc_freq[col] for term, col in engine.tfidf_vocabulary.items()
+                           if engine.tfidf_doc_freq[col] > 0}
+    }
+
+
+def _shard_sync(engine, stats, pagerank):
+    '''Получает от координатора глобальные статистики коллекции и PageRank страниц шарда'''
+    engine.set_collection_stats(stats)
+    if pagerank is not None:
+        engine.pagerank = pagerank
+        engine.pagerank_vector = np.array([pagerank[doc_id] if doc_id is not None else 0
+                                           for doc_id in engine.doc_ids])
+
+
+def _shard_search(engine, queries, weights, top_k, mode):
+    if mode == 'exhaustive':
+        return engine.search_many(queries, weights, top_k)
+    return [engine.search(query, weights, top_k, mode) for query in queries]
+
+
+_SHARD_COMMANDS = {
+    'apply': _shard_apply,
+    'build': _shard_build,
+    'stats': _shard_local_stats,
+    'sync': _shard_sync,
+    'search': _shard_search
+}
+
+
+def _shard_worker(conn):
+    '''Цикл процесса-шарда: выполняет команды координатора над своим SearchEngine'''
+    engine = SearchEngine(cache_size=0)
+    while True:
+        command, args = conn.recv()
+        if command is None:
+            break
+        try:
+            conn.send((True, _SHARD_COMMANDS[command](engine, *args)))
+        except Exception as error:
+            conn.send((False, error))
+    conn.close()
+
+
+class ShardedSearchEngine:
+    '''Поисковик, разбитый по документам на n_shards процессов-шардов
+        с глобальными статистиками BM25/TF-IDF и общим PageRank'''
+    def __init__(self, n_shards=None):
+        self.n_shards = n_shards or os.cpu_count()
+        # граф ссылок всей коллекции для PageRank (без текстов страниц)
+        self.graph = SearchEngine(cache_size=0)
+        self.shard_of = {}
+        self._next_shard = 0
+        self._operations = [[] for _ in range(self.n_shards)]
+        self._built = False
+        self._synced_generation = None
+        self.collection_stats = None
+
+        context = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else mp.get_context()
+        self._connections = []
+        self._processes = []
+        for _ in range(self.n_shards):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_shard_worker, args=(child_conn,), daemon=True)
+            process.start()
+            child_conn.close()
+            self._connections.append(parent_conn)
+            self._processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''Останавливает процессы шардов'''
+        for conn in self._connections:
+            conn.send((None, None))
+            conn.close()
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
+
+    @property
+    def pages(self):
+        return self.graph.pages
+
+    @property
+    def pagerank(self):
+        return self.graph.pagerank
+
+    def add_page(self, page):
+        '''Добавляет страницу в очередной шард (изменения отправляются шардам пакетом перед поиском)'''
+        if page['id'] not in self.shard_of:
+            self.shard_of[page['id']] = self._next_shard
+            self._next_shard = (self._next_shard + 1) % self.n_shards
+        self._operations[self.shard_of[page['id']]].append(('add', page))
+        self.graph.add_page({**page, 'content': ''})
+
+    def update_page(self, page):
+        self.add_page(page)
+
+    def delete_page(self, doc_id):
+        self._operations[self.shard_of.pop(doc_id)].append(('delete', doc_id))
+        self.graph.delete_page(doc_id)
+
+    def _scatter(self, command, shard_args):
+        '''Отправляет команду всем шардам (аргументы - свои для каждого шарда) и собирает ответы;
+            шарды выполняют ее параллельно'''
+        for conn, args in zip(self._connections, shard_args):
+            conn.send((command, args))
+        replies = [conn.recv() for conn in self._connections]
+        for ok, result in replies:
+            if not ok:
+                raise result
+        return [result for _, result in replies]
+
+    def _flush(self):
+        if any(self._operations):
+            self._scatter('apply', [(operations,) for operations in self._operations])
+            self._operations = [[] for _ in range(self.n_shards)]
+
+    def build_index(self):
+        '''Параллельно строит обратные индексы и TF-IDF во всех шардах'''
+        self._flush()
+        self._scatter('build', [()] * self.n_shards)
+        self._built = True
+        self._synced_generation = None
+
+    def compute_pagerank(self, **kwargs):
+        '''Вычисляет PageRank по графу ссылок всей коллекции (параметры - как у SearchEngine)'''
+        return self.graph.compute_pagerank(**kwargs)
+
+    def _sync(self):
+        '''Перед поиском отправляет шардам накопленные изменения, а затем глобальные статистики
+            коллекции и PageRank, если с прошлой синхронизации коллекция изменилась'''
+        if not self._built:
+            self.build_index()
+        self._flush()
+        self.graph._ensure_pagerank()
+        if self._synced_generation == self.graph.generation:
+            return
+
+        local_stats = self._scatter('stats', [()] * self.n_shards)
+        doc_freq, tfidf_doc_freq = Counter(), Counter()
+        for stats in local_stats:
+            doc_freq.update(stats['doc_freq'])
+            tfidf_doc_freq.update(stats['tfidf_doc_freq'])
+        total_docs = sum(stats['total_docs'] for stats in local_stats)
+        total_doc_len = sum(stats['total_doc_len'] for stats in local_stats)
+        self.collection_stats = {
+            'total_docs': total_docs,
+            'avg_doc_len': total_doc_len / total_docs if total_docs else 0.0,
+            'doc_freq': dict(doc_freq),
+            'tfidf_doc_freq': dict(tfidf_doc_freq)
+        }
+
+        pagerank_parts = [{} for _ in range(self.n_shards)]
+        for doc_id, shard in self.shard_of.items():
+            pagerank_parts[shard][doc_id] = self.graph.pagerank[doc_id]
+        self._scatter('sync', [(self.collection_stats, part) for part in pagerank_parts])
+        self._synced_generation = self.graph.generation
+
+    def search(self, query, weights=None, top_k=5, mode='exhaustive'):
+        '''Поиск по всем шардам (параметры и формат результата - как у SearchEngine.search)'''
+        return self.search_many([query], weights, top_k, mode)[0]
+
+    def search_many(self, queries, weights=None, top_k=5, mode='exhaustive'):
+        '''Рассылает пакет запросов всем шардам и объединяет их top_k по убыванию score
+            (при равенстве - в порядке добавления страниц, как в SearchEngine)'''
+        if weights is None:
+            weights = {'bm25': 0.34, 'tfidf': 0.33, 'pagerank': 0.33}
+        if mode not in ('exhaustive', 'maxscore'):
+            raise ValueError(f"Неизвестный режим поиска: {mode}")
+        queries = list(queries)
+        self._sync()
+
+        shard_results = self._scatter('search', [(queries, weights, top_k, mode)] * self.n_shards)
+        order = self.graph.doc_index
+        return [heapq.nsmallest(top_k, (result for results in shard_results for result in results[i]),
+                                key=lambda result: (-result['score'], order[result['id']]))
+                for i in range(len(queries))]